@@ -2,6 +2,7 @@
 import json
 import os
 import re
+from functools import lru_cache
 
 DATA_DIR = os.path.join('data', 'korkortsteori')
 DB_FILE = os.path.join(DATA_DIR, 'roadsigns_db.json')
@@ -105,38 +106,37 @@ raw_signs = [
 
 # Create standard naming convention map
 # We want clean filenames like: vagmarke_varning_farlig_kurva.svg
+_TRANS = str.maketrans({'å': 'a', 'ä': 'a', 'ö': 'o'})
+_CLEAN = re.compile(r'[^a-z0-9]+')
+
+@lru_cache(maxsize=None)
+def _norm(s):
+    # Only a handful of distinct categories, so this is almost always a cache hit
+    return s.lower().translate(_TRANS)
+
 def make_filename(category, name):
-    clean_name = name.lower()
-    clean_name = clean_name.replace('å', 'a').replace('ä', 'a').replace('ö', 'o')
-    clean_name = re.sub(r'[^a-z0-9]+', '_', clean_name)
-    clean_name = clean_name.strip('_')
+    clean_name = _CLEAN.sub('_', name.lower().translate(_TRANS)).strip('_')
+    cat_norm = _norm(category)
     
     # Prefix
     if 'vagmarke' not in clean_name:
         prefix = 'vagmarke_'
         # Add category if specific
         if category.lower() in ['varning', 'forbud', 'pabud', 'anvisning']:
-            prefix += category.lower().replace('å','a').replace('ä','a').replace('ö','o') + '_'
+            prefix += cat_norm + '_'
         
         # Avoid double prefix if name already contains category
-        if clean_name.startswith(category.lower().replace('å','a').replace('ä','a').replace('ö','o')):
+        if clean_name.startswith(cat_norm):
              clean_name = clean_name  # It already effectively has prefix
         else:
              clean_name = prefix + clean_name
             
     return f"{clean_name}.svg"
 
-new_db = []
-for name, wiki_file, category in raw_signs:
-    fname = make_filename(category, name)
-    
-    entry = {
-        "name": name,
-        "category": category,
-        "filename": fname,
-        "wiki_file": wiki_file
-    }
-    new_db.append(entry)
+new_db = [
+    {"name": name, "category": category, "filename": make_filename(category, name), "wiki_file": wiki_file}
+    for name, wiki_file, category in raw_signs
+]
 
 # Ensure directory
 if not os.path.exists(DATA_DIR):
@@ -144,6 +144,6 @@ if not os.path.exists(DATA_DIR):
 
 # Write DB
 with open(DB_FILE, 'w', encoding='utf-8') as f:
-    json.dump(new_db, f, indent=2, ensure_ascii=False)
+    f.write(json.dumps(new_db, indent=2, ensure_ascii=False))
 
 print(f"Created DB with {len(new_db)} signs at {DB_FILE}")
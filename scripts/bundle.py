@@ -1,76 +1,123 @@
 import os
+import sys
 import yaml
 import json
 import glob
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timezone
 
+# Prefer the libyaml-backed C loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Constants
 DATA_DIR = 'data'
 OUTPUT_FILE = 'public/content.json'
+IGNORE_DIRS = {'incorrectly_formatted_questions'}
+YAML_EXTENSIONS = ('.yaml', '.yml')
+
+def _dumps(obj):
+    """Serializes obj to a compact JSON string."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(obj)
+
+def _parse(path):
+    """Parses one YAML file. Runs in a worker process, so errors are returned, not raised."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return path, yaml.load(f, Loader=SafeLoader), None
+    except Exception as e:
+        return path, None, e
 
 def bundle():
     print(f"Scanning {DATA_DIR} for .yaml files...")
     
     subjects = {} # Structure: { "Folder": ["File1", "File2"] }
-    all_questions = []
+    sources = {} # Structure: { full_path: (subject, topic) }
     
     # Walk through data directory
     # We look for data/{Folder}/{File}.yaml
     for root, dirs, files in os.walk(DATA_DIR):
         # SKIP hidden folders or specific ignore folders
-        dirs[:] = [d for d in dirs if not d.startswith('.') and d != 'incorrectly_formatted_questions']
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d not in IGNORE_DIRS]
         
         for file in files:
-            if file.endswith(".yaml") or file.endswith(".yml"):
-                full_path = os.path.join(root, file)
+            if not file.endswith(YAML_EXTENSIONS):
+                continue
+            full_path = os.path.join(root, file)
+            
+            # Get Subject (Folder name) and Topic (Filename without ext)
+            rel_path = os.path.relpath(full_path, DATA_DIR)
+            parts = rel_path.split(os.sep)
+            
+            # We expect data/Subject/Topic.yaml so parts should be [Subject, Topic.yaml]
+            if len(parts) >= 2:
+                subject = parts[0]
+                topic = os.path.splitext(parts[-1])[0]
                 
-                # Get Subject (Folder name) and Topic (Filename without ext)
-                rel_path = os.path.relpath(full_path, DATA_DIR)
-                parts = rel_path.split(os.sep)
-                
-                # We expect data/Subject/Topic.yaml so parts should be [Subject, Topic.yaml]
-                if len(parts) >= 2:
-                    subject = parts[0]
-                    topic = os.path.splitext(parts[-1])[0]
-                    
-                    # Store in subjects map
-                    if subject not in subjects:
-                        subjects[subject] = []
-                    subjects[subject].append(topic)
-                    
-                    # Parse YAML
-                    try:
-                        with open(full_path, 'r', encoding='utf-8') as f:
-                            data = yaml.safe_load(f)
-                            
-                        if data and isinstance(data, list):
-                            print(f"  Loaded {len(data)} questions from {subject}/{topic}")
-                            # Append metadata to each question for tracking source
-                            for q in data:
-                                q['source'] = f"{subject}/{topic}"
-                                all_questions.append(q)
-                        else:
-                            print(f"  Warning: {full_path} is empty or not a list.")
-                            
-                    except Exception as e:
-                        print(f"  Error reading {full_path}: {e}")
+                # Store in subjects map
+                if subject not in subjects:
+                    subjects[subject] = []
+                subjects[subject].append(topic)
+                sources[full_path] = (subject, topic)
 
-    # Output structure
-    output = {
-        "subjects": subjects,
-        "questions": all_questions,
-        "meta": {
-            "total_questions": len(all_questions),
-            "generated_at": datetime.now(timezone.utc).isoformat() # ISO 8601 UTC
-        }
-    }
-    
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2)
+    # Parse YAML in parallel (CPU-bound, files are independent).
+    # map() keeps walk order, so the output is the same as a sequential run.
+    # Questions are streamed straight into content.json one file at a time
+    # instead of collecting the whole corpus in memory first. The stream goes
+    # to a temp file that replaces content.json only once it is complete, so
+    # a crash midway never leaves a truncated bundle behind.
+    total_questions = 0
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(OUTPUT_FILE), suffix='.tmp')
+    try:
+        os.fchmod(fd, 0o644) # mkstemp creates 0600; the bundle is served as a public asset
+        with os.fdopen(fd, 'w', encoding='utf-8') as out, \
+                ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            out.write('{"subjects":' + _dumps(subjects) + ',"questions":[')
+
+            for full_path, data, error in executor.map(_parse, sources, chunksize=8):
+                subject, topic = sources[full_path]
+                if error is not None:
+                    print(f"  Error reading {full_path}: {error}")
+                elif data and isinstance(data, list):
+                    print(f"  Loaded {len(data)} questions from {subject}/{topic}")
+                    # Append metadata to each question for tracking source
+                    # (one shared string per file rather than one per question)
+                    source = sys.intern(f"{subject}/{topic}")
+                    for i, q in enumerate(data):
+                        if not isinstance(q, dict):
+                            print(f"  Warning: skipping item {i} in {full_path}: not a mapping.")
+                            continue
+                        q['source'] = source
+                        if total_questions:
+                            out.write(',')
+                        out.write(_dumps(q))
+                        total_questions += 1
+                else:
+                    print(f"  Warning: {full_path} is empty or not a list.")
+
+            meta = {
+                "total_questions": total_questions,
+                "generated_at": datetime.now(timezone.utc).isoformat() # ISO 8601 UTC
+            }
+            out.write('],"meta":' + _dumps(meta) + '}')
+        os.replace(tmp_path, OUTPUT_FILE)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
         
     print(f"Bundle complete! wrote to {OUTPUT_FILE}")
     print(f"Total Subjects: {len(subjects)}")
-    print(f"Total Questions: {len(all_questions)}")
+    print(f"Total Questions: {total_questions}")
 
 if __name__ == '__main__':
     bundle()
@@ -1,47 +1,66 @@
 import os
 import yaml
-import glob
+
+import llm_cache
+
+# Prefer the libyaml-backed C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 DATA_DIR = 'data/medical_exam'
 
 def main():
     print("Starting cleanup of imported questions (ID starting with 'imp-')...")
     
-    yaml_files = glob.glob(os.path.join(DATA_DIR, '*.yaml'))
+    yaml_files = [e.path for e in os.scandir(DATA_DIR)
+                  if e.is_file() and e.name.endswith('.yaml')
+                  and 'incorrectly_formatted_questions' not in e.path]
     
     total_removed = 0
     
     for fpath in yaml_files:
-        if 'incorrectly_formatted_questions' in fpath:
-            continue
+        # One handle for both the read and the (rare) rewrite
+        with open(fpath, 'r+b') as f:
+            buf = f.read()
+            
+            # Cheap byte scan first: files without any imported IDs need no YAML parse
+            if b'imp-' not in buf:
+                continue
             
-        with open(fpath, 'r', encoding='utf-8') as f:
             try:
-                data = yaml.safe_load(f)
+                data = yaml.load(buf, Loader=SafeLoader)
             except Exception as e:
                 print(f"Error reading {fpath}: {e}")
                 continue
-        
-        if not data or not isinstance(data, list):
-            continue
             
-        original_count = len(data)
-        # Filter out questions with ID starting with 'imp-'
-        clean_data = [q for q in data if not (isinstance(q, dict) and q.get('id', '').startswith('imp-'))]
-        
-        removed_count = original_count - len(clean_data)
-        
-        if removed_count > 0:
-            with open(fpath, 'w', encoding='utf-8') as f:
-                yaml.dump(clean_data, f, allow_unicode=True, sort_keys=False)
-            print(f"Removed {removed_count} questions from {os.path.basename(fpath)}")
-            total_removed += total_removed + removed_count
+            if not data or not isinstance(data, list):
+                continue
+                
+            original_count = len(data)
+            # Filter out questions with ID starting with 'imp-'
+            clean_data = [q for q in data if not (isinstance(q, dict) and str(q.get('id', '')).startswith('imp-'))]
+            
+            removed_count = original_count - len(clean_data)
+            
+            if removed_count > 0:
+                f.seek(0)
+                f.truncate()
+                yaml.dump(clean_data, f, Dumper=SafeDumper, encoding='utf-8', allow_unicode=True, sort_keys=False, default_flow_style=False)
+                print(f"Removed {removed_count} questions from {os.path.basename(fpath)}")
+                total_removed += removed_count
     
     # Remove the log file
     log_file = os.path.join(DATA_DIR, 'new_questions_import_log.json')
     if os.path.exists(log_file):
         os.remove(log_file)
         print(f"Removed log file: {log_file}")
+    
+    # Cached import results would otherwise be replayed by the next import run
+    removed_entries = llm_cache.clear('imp-')
+    if removed_entries:
+        print(f"Removed {removed_entries} cached import results")
         
     print(f"Cleanup complete. Total removed: {total_removed}")
 
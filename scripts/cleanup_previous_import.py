@@ -2,6 +2,14 @@ import os
 import yaml
 import json
 
+import llm_cache
+
+# Prefer the libyaml-backed C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
 DATA_DIR = 'data/medical_exam'
 IMPORT_LOG = 'data/medical_exam/new_questions_import_log.json'
 
@@ -12,34 +20,42 @@ def main():
     files_cleaned = 0
     questions_removed = 0
     
-    for filename in os.listdir(DATA_DIR):
-        if not filename.endswith('.yaml'):
+    for entry in os.scandir(DATA_DIR):
+        if not entry.name.endswith('.yaml') or not entry.is_file():
             continue
             
-        filepath = os.path.join(DATA_DIR, filename)
+        filename, filepath = entry.name, entry.path
         
-        with open(filepath, 'r', encoding='utf-8') as f:
+        # One handle for both the read and the (rare) rewrite
+        with open(filepath, 'r+b') as f:
+            buf = f.read()
+            
+            # Cheap byte scan first: files without any imported IDs need no YAML parse
+            if b'imp-' not in buf:
+                continue
+            
             try:
-                data = yaml.safe_load(f)
+                data = yaml.load(buf, Loader=SafeLoader)
             except:
                 print(f"Skipping broken file: {filename}")
                 continue
+                    
+            if not isinstance(data, list):
+                continue
                 
-        if not isinstance(data, list):
-            continue
+            # Filter out questions starting with 'imp-'
+            original_count = len(data)
+            new_data = [q for q in data if not str(q.get('id', '')).startswith('imp-')]
             
-        # Filter out questions starting with 'imp-'
-        original_count = len(data)
-        new_data = [q for q in data if not str(q.get('id', '')).startswith('imp-')]
-        
-        removed = original_count - len(new_data)
-        
-        if removed > 0:
-            questions_removed += removed
-            files_cleaned += 1
-            with open(filepath, 'w', encoding='utf-8') as f:
-                yaml.dump(new_data, f, sort_keys=False, allow_unicode=True)
-            print(f"cleaned {filename}: removed {removed} questions.")
+            removed = original_count - len(new_data)
+            
+            if removed > 0:
+                questions_removed += removed
+                files_cleaned += 1
+                f.seek(0)
+                f.truncate()
+                yaml.dump(new_data, f, Dumper=SafeDumper, encoding='utf-8', sort_keys=False, allow_unicode=True, default_flow_style=False)
+                print(f"cleaned {filename}: removed {removed} questions.")
 
     print(f"\nTotal questions removed: {questions_removed} from {files_cleaned} files.")
 
@@ -52,6 +68,10 @@ def main():
     else:
         print("\nLog file not found, nothing to reset.")
 
+    # 3. Drop cached import results, or the re-run would replay them
+    removed_entries = llm_cache.clear('imp-')
+    print(f"\nRemoved {removed_entries} cached import results.")
+
     print("\nCleanup complete. You can now re-run the import script.")
 
 if __name__ == "__main__":
@@ -3,13 +3,24 @@ import yaml
 import re
 import os
 
+# Prefer the libyaml-backed C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+# Compiled once at import instead of on every question
+_PAREN = re.compile(r'\s*\([^\)]+\)(\?)?')
+_QUOTED_SIGN = re.compile(r"skylten\s+['\"].+?['\"]", re.IGNORECASE)
+_QUOTED_MARK = re.compile(r"märket\s+['\"].+?['\"]", re.IGNORECASE)
+
 def clean_questions(file_path):
     if not os.path.exists(file_path):
         print(f"File not found: {file_path}")
         return
 
     with open(file_path, 'r', encoding='utf-8') as f:
-        data = yaml.safe_load(f)
+        data = yaml.load(f, Loader=SafeLoader)
 
     if not data:
         return
@@ -36,16 +47,15 @@ def clean_questions(file_path):
         
         old_q = q['question']
         
-        # Remove filename in parens
-        new_q = re.sub(r'\s*\([^\)]+\)\?', '?', old_q) # Remove (filename)? at end
-        new_q = re.sub(r'\s*\([^\)]+\)', '', new_q)    # Remove (filename) anywhere
+        # Remove filename in parens, anywhere; a "(filename)?" keeps its '?'
+        new_q = _PAREN.sub(r'\1', old_q)
         
         # Remove quoted name
         # Ex: "Vad betyder skylten 'Förbud mot infart'?" -> "Vad betyder denna skylt?"
         if "'" in new_q or '"' in new_q:
             # Try to replace specific phrase patterns
-            new_q = re.sub(r"skylten\s+['\"].+?['\"]", "denna skylt", new_q, flags=re.IGNORECASE)
-            new_q = re.sub(r"märket\s+['\"].+?['\"]", "detta märke", new_q, flags=re.IGNORECASE)
+            new_q = _QUOTED_SIGN.sub("denna skylt", new_q)
+            new_q = _QUOTED_MARK.sub("detta märke", new_q)
         
         if new_q != old_q:
             print(f"Fixed: {old_q} -> {new_q}")
@@ -55,7 +65,7 @@ def clean_questions(file_path):
         cleaned_data.append(q)
 
     with open(file_path, 'w', encoding='utf-8') as f:
-        yaml.dump(cleaned_data, f, sort_keys=False, allow_unicode=True)
+        yaml.dump(cleaned_data, f, Dumper=SafeDumper, sort_keys=False, allow_unicode=True, default_flow_style=False)
 
     print(f"Cleaned {count} questions. Removed {removed_count} broken questions.")
 
@@ -1,9 +1,19 @@
 import os
-import urllib.request
 import urllib.parse
 import sys
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import urllib3
 
 SCENARIOS_DIR = os.path.join('public', 'assets', 'scenarios')
+MAX_WORKERS = 8
+
+# Shared keep-alive pool: every download goes to commons.wikimedia.org, so
+# TCP/TLS connections are reused instead of re-handshaking per image.
+http = urllib3.PoolManager(
+    maxsize=MAX_WORKERS,
+    headers={'User-Agent': 'Iller6dev/1.0 (https://github.com/example/iller6)'}
+)
 
 # List of Wikimedia Commons filenames that depict traffic scenarios
 SCENARIO_FILES = [
@@ -43,13 +53,7 @@ VALIDATED_FILES = [
 
 
 def download_file(filename):
-    if not os.path.exists(SCENARIOS_DIR):
-        os.makedirs(SCENARIOS_DIR)
-        
     filepath = os.path.join(SCENARIOS_DIR, filename)
-    if os.path.exists(filepath):
-        print(f"Exists: {filename}")
-        return
 
     # Use Special:FilePath
     encoded_name = urllib.parse.quote(filename)
@@ -60,22 +64,42 @@ def download_file(filename):
         url += "?width=1024"
 
     print(f"Downloading {filename}...")
+    part_path = filepath + '.part'
     try:
-        req = urllib.request.Request(
-            url, 
-            headers={'User-Agent': 'Iller6dev/1.0 (https://github.com/example/iller6)'}
-        )
-        with urllib.request.urlopen(req) as response, open(filepath, 'wb') as out_file:
-            data = response.read()
-            out_file.write(data)
-        print("Success.")
+        # Stream to a .part file in 64 KB chunks and only rename on success,
+        # so an interrupted download never leaves a truncated image behind
+        # (which the exists-check in main() would otherwise treat as done).
+        response = http.request('GET', url, preload_content=False)
+        try:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            with open(part_path, 'wb') as out_file:
+                shutil.copyfileobj(response, out_file, 1 << 16)
+        finally:
+            response.release_conn()
+        os.replace(part_path, filepath)
+        print(f"Success: {filename}")
     except Exception as e:
-        print(f"Failed: {e}")
+        print(f"Failed: {filename}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
 
 def main():
     print(f"Fetching {len(VALIDATED_FILES)} scenario images...")
+    os.makedirs(SCENARIOS_DIR, exist_ok=True)
+
+    # One directory read instead of a stat() per file
+    existing = {e.name for e in os.scandir(SCENARIOS_DIR)}
+    to_download = []
     for f in VALIDATED_FILES:
-        download_file(f)
+        if f in existing:
+            print(f"Exists: {f}")
+        else:
+            to_download.append(f)
+
+    # Downloads are network-bound, so threads overlap the waiting
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(download_file, to_download))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,49 @@
+# Shared write helpers for the question files, logs and sidecars the scripts
+# keep under data/: crash-safe rewrites and cheap appends to YAML lists.
+import os
+import tempfile
+import yaml
+
+# Prefer the libyaml-backed C dumper when PyYAML was built with it
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+def atomic_write_bytes(path, data):
+    """Writes data to path via a temp file + rename, so a crash never leaves a truncated file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        os.fchmod(fd, 0o644) # mkstemp creates 0600; keep the mode a plain open() would give
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def is_block_list(filepath):
+    """True if the file's first content line starts a block-style top-level list."""
+    try:
+        f = open(filepath, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return False
+    with f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#') or stripped == '---':
+                continue
+            return line.startswith('- ') or stripped == '-'
+    return False
+
+def append_to_block_list(filepath, items):
+    """Appends items to a block-list YAML file (see is_block_list) without re-serializing the existing ones."""
+    # A block list dumped by PyYAML concatenates cleanly onto another block list
+    chunk = yaml.dump(items, Dumper=SafeDumper, encoding='utf-8', sort_keys=False, allow_unicode=True, default_flow_style=False)
+    with open(filepath, 'a+b') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                chunk = b'\n' + chunk
+        f.write(chunk)
@@ -1,55 +1,102 @@
 import os
 import sys
+import asyncio
 import yaml
-import json
-import uuid
 import collections
+import functools
+import itertools
+import math
 import random
-import urllib.request
+import secrets
+import shutil
+import threading
 import urllib.parse
 import base64
-from typing import List, Optional
-from pydantic import BaseModel, Field
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import orjson
+import httpx
+import urllib3
+import fastjsonschema
+from openai import OpenAI, AsyncOpenAI
+
+import llm_cache
+from file_io import atomic_write_bytes, is_block_list, append_to_block_list
+
+# Prefer the libyaml-backed C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 # -------------------------------------------------------------------------
 # SETUP
 # -------------------------------------------------------------------------
 client = OpenAI() 
+aclient = AsyncOpenAI()
+
+# The main generator talks to the API over plain HTTP; --sdk switches it
+# back to the OpenAI client.
+USE_SDK = '--sdk' in sys.argv
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
+http_client = httpx.AsyncClient(timeout=120)
+# Same credentials as the SDK clients; OpenAI() above already fails with a
+# clear message when no API key is configured.
+API_HEADERS = {
+    "Authorization": f"Bearer {client.api_key}",
+    "Content-Type": "application/json",
+}
+RETRY_ATTEMPTS = 3 # Plain-HTTP requests: tries per call on 429/5xx/connection errors
+
+_print_lock = threading.Lock()
+
+# Shared keep-alive pool for image downloads, so concurrent downloads from
+# the same host reuse TCP/TLS connections.
+DOWNLOAD_WORKERS = 8
+http = urllib3.PoolManager(
+    maxsize=DOWNLOAD_WORKERS,
+    headers={'User-Agent': 'Iller6dev/1.0 (https://github.com/example/iller6)'}
+)
 
 DATA_DIR = 'data'
 ASSETS_DIR = os.path.join('public', 'assets')
+# Images per vision request, and parallel vision requests, in the scenario
+# generator (keep under the API rate limits)
+SCENARIO_BATCH_SIZE = 4
+SCENARIO_CONCURRENCY = int(os.environ.get('ILLER6_CONCURRENCY', '8'))
+# Subject-specific ID prefixes for better readability (others use the first 3 characters)
+ID_PREFIX_MAP = {
+    'korkortsteori': 'kor',
+    'medical_exam': 'med',
+}
+TAG_INDEX_FILE = '.tags.idx.json' # Per-subject tag count sidecar (see analyze_subject)
+
+# Questions per request when a generation run is split up, and how many of
+# those requests may be in flight at once (stay under the API rate limits)
+BATCH_SIZE = 5
+MAX_CONCURRENT_REQUESTS = 4
 
 # -------------------------------------------------------------------------
-# PYDANTIC MODELS (Structured Output 2025/2026 Standard)
+# RESPONSE PARSING (Structured Output 2025/2026 Standard)
 # -------------------------------------------------------------------------
 
 # Note:
-# - The Pydantic models validate the model output we receive (Python-side safety).
+# - Strict mode already guarantees the response matches the schema, so the
+#   model output is parsed straight into plain dicts (ready for YAML saving)
+#   without a typed validation pass. Run with --validate (or ILLER6_VALIDATE=1)
+#   to check it against the schema anyway.
 # - OpenAI Structured Outputs requires an explicit JSON Schema (response_format json_schema).
 #   We keep a separate schema builder to guarantee strict requirements like
 #   additionalProperties=false across all nested objects.
 
-# Helper for OpenAI Strict Mode (requires additionalProperties: false)
-class StrictBaseModel(BaseModel):
-    model_config = {"extra": "forbid"}
-
-class Option(StrictBaseModel):
-    text: str = Field(..., description="Svarsalternativets text")
-    correct: bool = Field(..., description="True om detta är rätt svar, annars False")
-    feedback: str = Field(..., description="Mycket koncis feedback (1 mening) om varför detta är rätt eller fel. Börja INTE med 'Rätt' eller 'Fel'.")
-
-class Question(StrictBaseModel):
-    id: str = Field(..., description="Ett unikt ID, t.ex 'med-gen-ab12'")
-    type: str = Field("multiple_choice", description="Alltid 'multiple_choice'")
-    tags: List[str] = Field(..., description="1-3 korta taggar på svenska (t.ex 'Anatomi') OBS: Taggar ska inte ge bort svaret.")
-    question: str = Field(..., description="Själva frågetexten")
-    image: Optional[str] = Field(None, description="Filename i assets eller null")
-    options: List[Option]
-    explanation: str = Field(..., description="Övergripande koncis förklaring (2-3 meningar)")
+VALIDATE = '--validate' in sys.argv or os.environ.get('ILLER6_VALIDATE') == '1'
 
-class QuestionBatch(StrictBaseModel):
-    questions: List[Question]
+def decode_batch(raw_json: str) -> List[dict]:
+    """Parses a strict-mode LLM response into a list of question dicts."""
+    parsed = orjson.loads(raw_json)
+    if VALIDATE:
+        VALIDATE_BATCH(parsed)
+    return parsed['questions']
 
 
 def build_question_batch_schema():
@@ -117,10 +164,41 @@ def build_question_batch_schema():
         "required": ["questions"],
     }
 
+def _strip_desc(schema):
+    """Returns a copy of a JSON Schema without any 'description' keys."""
+    if isinstance(schema, dict):
+        return {k: _strip_desc(v) for k, v in schema.items() if k != 'description'}
+    if isinstance(schema, list):
+        return [_strip_desc(v) for v in schema]
+    return schema
+
+def _describe_fields(schema, prefix=''):
+    """Yields 'field: description' lines for every described property in a schema."""
+    for name, prop in schema.get('properties', {}).items():
+        if 'description' in prop:
+            yield f"- {prefix}{name}: {prop['description']}"
+        items = prop.get('items', {})
+        if items.get('type') == 'object':
+            yield from _describe_fields(items, f"{prefix}{name}[].")
+
+# The schema is a constant; build it once instead of on every request.
+# The FULL schema documents each field; the descriptions are moved into the
+# system prompts (FIELD_GUIDE) and the WIRE schema sent with every request
+# leaves them out, which keeps the request body small.
+QUESTION_BATCH_SCHEMA_FULL = build_question_batch_schema()
+QUESTION_BATCH_SCHEMA_WIRE = _strip_desc(QUESTION_BATCH_SCHEMA_FULL)
+FIELD_GUIDE = "\n\nFÄLT I SVARET:\n" + "\n".join(_describe_fields(QUESTION_BATCH_SCHEMA_FULL))
+# Compiled once into a specialized Python function (used with --validate)
+VALIDATE_BATCH = fastjsonschema.compile(QUESTION_BATCH_SCHEMA_WIRE)
+
 # -------------------------------------------------------------------------
 # PROMPTS
 # -------------------------------------------------------------------------
 
+# System prompts are fixed constants so every request starts with the same
+# prefix, which the API's prompt cache can reuse (see PROMPT_CACHE_KEY).
+PROMPT_CACHE_KEY = "iller6-gen-v1"
+
 # Medical exam system prompt (default)
 SYSTEM_PROMPT_MEDICAL = """
 Du är en expertlärare som skapar högkvalitativa, avancerade flashcards-frågor.
@@ -133,7 +211,7 @@ INNEHÅLLSKRAV:
 1. Feedback MÅSTE vara koncis (1 mening). Börja INTE med "Rätt" eller "Fel", det visas automatiskt.
 2. Explanation MÅSTE vara syntes-orienterad (2-3 meningar).
 3. Svårighetsgrad: Läkarexamen / Specialistnivå.
-"""
+""".strip() + FIELD_GUIDE
 
 # Körkortsteori system prompt
 SYSTEM_PROMPT_KORKORTSTEORI = """
@@ -156,7 +234,23 @@ INNEHÅLLSKRAV:
 8. SVARSALTERNATIV: De felaktiga alternativen (distraktorerna) ska vara trovärdiga och semi-relaterade till ämnet.
    - Undvik uppenbart felaktiga påståenden (som 'Snöröjning pågår' för en motorvägsskylt).
    - Alternativen ska vara sådana som en orutinerad förare rimligen skulle kunna blanda ihop med det rätta svaret.
-"""
+""".strip() + FIELD_GUIDE
+
+# Körkortsteori prompt tweaked for Vision (scenario images)
+SYSTEM_PROMPT_SCENARIO = SYSTEM_PROMPT_KORKORTSTEORI + "\n\nOBS: Du kommer få en bild på en trafiksituation. Din uppgift är att skapa en teorifråga baserad på vad föraren ser (man ser inte alltid motorhuven/ratten, men utgå från kamerans perspektiv). Identifiera risker, regler eller vägmärken i bilden."
+
+# Options shared by every Structured Outputs request (built once)
+CHAT_KWARGS_STRICT = {
+    "response_format": {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "question_batch",
+            "schema": QUESTION_BATCH_SCHEMA_WIRE,
+            "strict": True
+        }
+    },
+    "prompt_cache_key": PROMPT_CACHE_KEY,
+}
 
 def get_system_prompt(subject: str) -> str:
     """Returns appropriate system prompt based on subject."""
@@ -169,71 +263,181 @@ def get_system_prompt(subject: str) -> str:
 # FUNCTIONS
 # -------------------------------------------------------------------------
 
+def _chat(model, system, user_content, **extra):
+    """Sends one strict Structured Outputs request and returns the raw JSON content."""
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": user_content}
+        ],
+        **CHAT_KWARGS_STRICT,
+        **extra
+    )
+    return completion.choices[0].message.content
+
 def get_subjects():
     """Returns a list of folders in data/ excluding hidden/utility folders."""
-    return [d for d in os.listdir(DATA_DIR) 
-            if os.path.isdir(os.path.join(DATA_DIR, d)) 
-            and not d.startswith('.') 
-            and d != 'incorrectly_formatted_questions']
+    return [e.name for e in os.scandir(DATA_DIR)
+            if e.is_dir(follow_symlinks=False)
+            and not e.name.startswith('.')
+            and e.name != 'incorrectly_formatted_questions']
 
 def get_topics(subject):
     """Returns list of .yaml filenames in data/subject/"""
-    path = os.path.join(DATA_DIR, subject)
-    if not os.path.exists(path): return []
-    return [f for f in os.listdir(path) if f.endswith('.yaml')]
+    try:
+        entries = os.scandir(os.path.join(DATA_DIR, subject))
+    except FileNotFoundError:
+        return []
+    with entries:
+        return [e.name for e in entries if e.name.endswith('.yaml') and e.is_file()]
 
 def load_existing(filepath):
     """Loads existing YAML."""
-    if not os.path.exists(filepath):
+    # Bytes go straight to the (C) loader, which decodes UTF-8 itself;
+    # the large buffer keeps big topic files to a few read calls.
+    try:
+        f = open(filepath, 'rb', buffering=1 << 20)
+    except FileNotFoundError:
         return []
-    with open(filepath, 'r', encoding='utf-8') as f:
+    with f:
         try:
-            return yaml.safe_load(f) or []
+            return yaml.load(f, Loader=SafeLoader) or []
         except:
             return []
 
-def analyze_existing_content(questions):
-    """Summary of existing Tags for the prompt."""
-    tag_counts = collections.Counter()
-    
-    for q in questions:
-        tags = q.get('tags', [])
-        if isinstance(tags, list):
-            for t in tags:
-                tag_counts[t] += 1
-                
-    summary = {tag: count for tag, count in tag_counts.most_common(50)}
-    return summary, len(questions)
+@functools.lru_cache(maxsize=None)
+def _load_cached(filepath, mtime):
+    return load_existing(filepath)
 
+def load_existing_cached(filepath):
+    """Like load_existing, but memoized per (path, mtime). Treat the result as read-only."""
+    try:
+        mtime = os.path.getmtime(filepath)
+    except OSError:
+        return []
+    return _load_cached(filepath, mtime)
 
-def analyze_tag_usage_across_subject(subject: str):
-    """Counts tag usage across all topics within a subject folder."""
-    tag_counts = collections.Counter()
-    total_questions = 0
+def append_questions(filepath, existing, new_data):
+    """Appends new_data to a topic file without re-serializing the existing questions.
 
-    subject_path = os.path.join(DATA_DIR, subject)
-    if not os.path.isdir(subject_path):
-        return {}, 0
+    existing may be None if the caller has not loaded the file; it is then only
+    read if the file has to be rewritten.
+    """
+    # A block list dumped by PyYAML concatenates cleanly onto another block list,
+    # so only the new items are written. Anything else gets a full rewrite.
+    if existing is None:
+        appendable = is_block_list(filepath)
+    else:
+        appendable = existing and isinstance(existing, list) and is_block_list(filepath)
+    if appendable:
+        append_to_block_list(filepath, new_data)
+        return
+    if existing is None:
+        existing = load_existing(filepath)
+    atomic_write_bytes(filepath, yaml.dump(list(existing or []) + new_data, Dumper=SafeDumper, encoding='utf-8', sort_keys=False, allow_unicode=True))
 
-    for fname in os.listdir(subject_path):
-        if not (fname.endswith('.yaml') or fname.endswith('.yml')):
-            continue
-        full_path = os.path.join(subject_path, fname)
-        questions = load_existing(full_path)
-        if not isinstance(questions, list):
-            continue
+def _top_tags(counts, k, total):
+    """Returns the k most common tags as a dict, without the long tail of rare ones."""
+    # Rare tags add prompt tokens but little guidance. Single-use tags are dropped
+    # once there are more than k distinct tags (which of them would make the cut
+    # is arbitrary anyway), and big folders raise the bar with their size.
+    min_count = max(2 if len(counts) > k else 1, total // 200)
+    return {tag: count for tag, count in counts.most_common(k) if count >= min_count}
 
-        for q in questions:
-            if not isinstance(q, dict):
+def format_tag_summary(summary):
+    """Serializes a tag summary compactly as 'tag:count,tag:count' for the prompt."""
+    return ",".join(f"{tag}:{count}" for tag, count in summary.items())
+
+def _tag_entry(questions, st):
+    """Returns the tag index entry (tag counts and used images) for one topic file's questions."""
+    dict_questions = [q for q in questions if isinstance(q, dict)]
+    # Flatten once per file; Counter does the counting loop in C. Tags are
+    # counted as strings: YAML reads e.g. `2020` or `true` as int/bool, and the
+    # index (JSON) only has string keys.
+    file_tags = collections.Counter(map(str, itertools.chain.from_iterable(
+        tags for tags in (q.get('tags', []) for q in dict_questions)
+        if isinstance(tags, list))))
+    images = sorted({q['image'] for q in dict_questions if q.get('image')})
+    return {'mtime': st.st_mtime, 'size': st.st_size, 'n': len(dict_questions),
+            'tags': dict(file_tags), 'images': images}
+
+def load_tag_index(subject):
+    """Loads a subject's tag index ({filename: {mtime, size, n, tags, images}}), or {} if there is none."""
+    try:
+        with open(os.path.join(DATA_DIR, subject, TAG_INDEX_FILE), 'rb') as f:
+            index = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return {}
+    return index if isinstance(index, dict) else {}
+
+def save_tag_index(subject, index):
+    """Writes a subject's tag index (atomic rename, so no torn files)."""
+    atomic_write_bytes(os.path.join(DATA_DIR, subject, TAG_INDEX_FILE), orjson.dumps(index))
+
+def update_tag_index(subject, filename, new_questions):
+    """Adds questions just appended to a topic file to its tag index entry."""
+    index = load_tag_index(subject)
+    entry = index.get(filename)
+    if entry is None:
+        return # Not indexed yet; the next scan parses the file
+    counts = collections.Counter(entry['tags'])
+    st = os.stat(os.path.join(DATA_DIR, subject, filename))
+    added = _tag_entry(new_questions, st)
+    counts.update(added['tags'])
+    images = sorted(set(entry['images']).union(added['images']))
+    index[filename] = dict(added, n=entry['n'] + added['n'], tags=dict(counts), images=images)
+    save_tag_index(subject, index)
+
+def analyze_subject(subject: str, selected_filename: str):
+    """Counts tag usage across a subject folder and within the selected topic in one pass.
+
+    Returns (topic_summary, topic_total, subject_summary, subject_total, used_images).
+    """
+    topic_counts = collections.Counter()
+    subject_counts = collections.Counter()
+    topic_total = 0
+    subject_total = 0
+    used_images = set()
+
+    # Opening the listing doubles as the existence check (no separate isdir stat)
+    try:
+        entries = os.scandir(os.path.join(DATA_DIR, subject))
+    except OSError:
+        return {}, 0, {}, 0, used_images
+
+    # Per-file tag counts live in a JSON sidecar; only files whose mtime or
+    # size changed since the last scan are parsed as YAML again.
+    index = load_tag_index(subject)
+    fresh_index = {}
+    with entries:
+        for entry in entries:
+            if not entry.name.endswith(('.yaml', '.yml')) or not entry.is_file():
                 continue
-            tags = q.get('tags', [])
-            if isinstance(tags, list):
-                for t in tags:
-                    tag_counts[t] += 1
-            total_questions += 1
+            st = entry.stat()
+            file_entry = index.get(entry.name)
+            if (not file_entry or file_entry.get('mtime') != st.st_mtime
+                    or file_entry.get('size') != st.st_size or 'images' not in file_entry):
+                # entry.path matches the path main() uses, so the topic file hits the cache
+                questions = _load_cached(entry.path, st.st_mtime)
+                if not isinstance(questions, list):
+                    continue
+                file_entry = _tag_entry(questions, st)
+            fresh_index[entry.name] = file_entry
+
+            subject_counts.update(file_entry['tags'])
+            subject_total += file_entry['n']
+            used_images.update(file_entry['images'])
+            if entry.name == selected_filename:
+                topic_counts.update(file_entry['tags'])
+                topic_total = file_entry['n']
+
+    if fresh_index != index:
+        save_tag_index(subject, fresh_index)
 
-    summary = {tag: count for tag, count in tag_counts.most_common(100)}
-    return summary, total_questions
+    topic_summary = _top_tags(topic_counts, 50, topic_total)
+    subject_summary = _top_tags(subject_counts, 100, subject_total)
+    return topic_summary, topic_total, subject_summary, subject_total, used_images
 
 def get_road_sign_context(subject: str) -> str:
     """Returns context about Swedish road signs if subject is körkortsteori."""
@@ -263,15 +467,13 @@ När du skapar en fråga om ett specifikt vägmärke:
 # -------------------------------------------------------------------------
 def download_image(url, filename):
     """Downloads image/svg from URL and saves to public/assets/."""
-    if not os.path.exists(ASSETS_DIR):
-        os.makedirs(ASSETS_DIR)
-        
     filepath = os.path.join(ASSETS_DIR, filename)
     if os.path.exists(filepath):
-        print(f"  [Skip] Image already exists: {filename}")
+        _log(f"  [Skip] Image already exists: {filename}")
         return True
         
-    print(f"  [Download] Fetching from: {url}")
+    _log(f"  [Download] Fetching from: {url}")
+    part_path = filepath + '.part'
     try:
         # Wikimedia Special:FilePath with width param redirects to a scaled PNG
         # Even for SVGs, asking for ?width=600 typically gives a PNG thumb
@@ -279,35 +481,61 @@ def download_image(url, filename):
              if '?' not in url:
                  url += "?width=600"
         
-        # User-Agent is required by Wikipedia
-        req = urllib.request.Request(
-            url, 
-            headers={'User-Agent': 'Iller6dev/1.0 (https://github.com/example/iller6)'}
-        )
-        with urllib.request.urlopen(req) as response, open(filepath, 'wb') as out_file:
-            data = response.read()
-            out_file.write(data)
+        # The shared pool sends the User-Agent (required by Wikipedia).
+        # Stream to a .part file in 64 KB chunks and only rename on success,
+        # so a failed download never leaves a truncated image behind.
+        response = http.request('GET', url, preload_content=False)
+        try:
+            if response.status != 200:
+                raise RuntimeError(f"HTTP {response.status}")
+            with open(part_path, 'wb') as out_file:
+                shutil.copyfileobj(response, out_file, 1 << 16)
+        finally:
+            response.release_conn()
+        os.replace(part_path, filepath)
         
-        print(f"  [Success] Saved to {filepath}")
+        _log(f"  [Success] Saved to {filepath}")
         return True
     except Exception as e:
-        print(f"  [Error] Failed to download {url}: {e}")
+        _log(f"  [Error] Failed to download {url}: {e}")
+        if os.path.exists(part_path):
+            os.remove(part_path)
         return False
 
+_SENTINEL = object()
+
+def _random_open():
+    """Returns a uniform random float in the open interval (0, 1)."""
+    u = random.random()
+    while u == 0.0:
+        u = random.random()
+    return u
+
+def _reservoir(iterable, k):
+    """Returns k items sampled uniformly at random from iterable (Li's Algorithm L).
+
+    Skips ahead geometrically instead of drawing a random number per item, and
+    never copies the input.
+    """
+    it = iter(iterable)
+    sample = list(itertools.islice(it, k))
+    if len(sample) < k or k == 0:
+        return sample
+    w = math.exp(math.log(_random_open()) / k)
+    while True:
+        # w can round up to 1.0 for large k; the skip length tends to 0 there
+        # (and log(1 - w) would fail), so take the next item
+        skip = 0 if w >= 1.0 else math.floor(math.log(_random_open()) / math.log(1 - w))
+        item = next(itertools.islice(it, skip, None), _SENTINEL)
+        if item is _SENTINEL:
+            return sample
+        sample[random.randrange(k)] = item
+        w *= math.exp(math.log(_random_open()) / k)
+
 def get_existing_sign_filenames(subject='korkortsteori'):
     """Finds all image filenames already used in question files."""
-    used_images = set()
-    subject_path = os.path.join(DATA_DIR, subject)
-    if not os.path.exists(subject_path):
-        return used_images
-    
-    for fname in os.listdir(subject_path):
-        if fname.endswith('.yaml') or fname.endswith('.yml'):
-            questions = load_existing(os.path.join(subject_path, fname))
-            for q in questions:
-                if q.get('image'):
-                    used_images.add(q['image'])
-    return used_images
+    # Same pass (and tag index) as the tag analysis
+    return analyze_subject(subject, None)[4]
 
 def run_roadsign_generator(count=5):
     """
@@ -317,12 +545,12 @@ def run_roadsign_generator(count=5):
     4. Generates questions for those signs
     """
     db_path = os.path.join(DATA_DIR, 'korkortsteori', 'roadsigns_db.json')
-    if not os.path.exists(db_path):
+    try:
+        with open(db_path, 'rb') as f:
+            road_signs = orjson.loads(f.read())
+    except FileNotFoundError:
         print(f"Error: {db_path} not found. Please create it first.")
         return
-
-    with open(db_path, 'r', encoding='utf-8') as f:
-        road_signs = json.load(f)
     
     if not road_signs:
         print("No signs in DB.")
@@ -345,12 +573,11 @@ def run_roadsign_generator(count=5):
     if count >= len(available_signs):
          selected_signs = available_signs
     else:
-         selected_signs = random.sample(available_signs, count)
+         selected_signs = _reservoir(available_signs, count)
     
     print(f"\nProcessing {len(selected_signs)} new road signs...")
     
-    signs_context = []
-    
+    tasks = []
     for sign in selected_signs:
         # Resolve URL
         # If 'url' key exists, use it. If 'wiki_file' exists, construct Special:FilePath URL
@@ -368,13 +595,22 @@ def run_roadsign_generator(count=5):
             # For automation, this is easiest.
             encoded_wiki = urllib.parse.quote(wiki_file)
             download_url = f"https://commons.wikimedia.org/wiki/Special:FilePath/{encoded_wiki}"
-            
-        if download_image(download_url, target_filename):
-            signs_context.append({
-                "name": sign['name'],
-                "category": sign.get('category', 'Unknown'),
-                "image_file": target_filename
-            })
+        tasks.append((download_url, target_filename))
+    
+    # Downloads are network-bound, so threads overlap the waiting;
+    # map() keeps selected_signs order.
+    os.makedirs(ASSETS_DIR, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        downloaded = list(executor.map(lambda task: download_image(*task), tasks))
+    
+    signs_context = [
+        {
+            "name": sign['name'],
+            "category": sign.get('category', 'Unknown'),
+            "image_file": sign.get('filename')
+        }
+        for sign, ok in zip(selected_signs, downloaded) if ok
+    ]
             
     if not signs_context:
         print("No images available to generate questions for.")
@@ -409,48 +645,80 @@ def run_roadsign_generator(count=5):
     """
     
     try:
-        completion = client.chat.completions.create(
-            model="gpt-5-mini", 
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "question_batch",
-                    "schema": build_question_batch_schema(),
-                    "strict": True
-                }
-            }
-        )
-        
-        raw_json = completion.choices[0].message.content
-        batch = QuestionBatch.model_validate_json(raw_json)
+        raw_json = _chat("gpt-5-mini", system_prompt, user_prompt)
+        new_data = decode_batch(raw_json)
         
         # Save to specific file
         output_file = os.path.join(DATA_DIR, 'korkortsteori', 'vagmarken_auto.yaml')
-        existing_data = load_existing(output_file)
-        
-        new_data = [q.model_dump() for q in batch.questions]
         
         # Ensure unique IDs
         for q in new_data:
-             q['id'] = f"kor-auto-{uuid.uuid4().hex[:6]}"
+             q['id'] = f"kor-auto-{secrets.token_hex(3)}"
 
-        all_data = existing_data + new_data
-        
-        with open(output_file, 'w', encoding='utf-8') as f:
-            yaml.dump(all_data, f, sort_keys=False, allow_unicode=True)
+        # Append to file (the existing questions are not even loaded)
+        append_questions(output_file, None, new_data)
             
         print(f"\nSUCCÉ! Genererade {len(new_data)} frågor och sparade till {output_file}")
         
     except Exception as e:
         print(f"Error during auto-generation: {e}")
 
-def encode_image(image_path):
+def image_data_url(image_path, mime='image/jpeg'):
+    """Returns the image as a base64 data URL, encoded in chunks."""
+    # Chunks are a multiple of 3 bytes, so the pieces concatenate into one
+    # valid base64 string without ever holding the whole raw file in memory.
+    out = bytearray(f"data:{mime};base64,".encode('ascii'))
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        while chunk := image_file.read(57 * 1024):
+            out += base64.b64encode(chunk)
+    return out.decode('ascii')
+
+def _log(message):
+    """Prints one line at a time from worker threads."""
+    with _print_lock:
+        print(message)
+
+def _generate_for_images(img_files):
+    """Generates one scenario question per image in a single request. Returns a list of dicts, or None on failure."""
+    _log(f"  > Analyzing {', '.join(img_files)}...")
+    
+    # One text block, then each image labelled with its asset path. The model
+    # echoes that label in the question's image field, so questions are matched
+    # to images by label rather than by their (unreliable) order.
+    labels = {f"scenarios/{img_file}": img_file for img_file in img_files} # Relative to assets/
+    content = [{"type": "text", "text": f"Analysera trafiksituationen i var och en av de {len(img_files)} bifogade bilderna. Skapa EN utmanande körkortsfråga (flerval) per bild och sätt frågans image-fält till bildens etikett (t.ex. \"{next(iter(labels))}\"). Vad bör föraren tänka på? Vilka regler gäller? Var specifik kopplat till bildens innehåll."}]
+    for label, img_file in labels.items():
+        content.append({"type": "text", "text": f"Bild {label}:"})
+        content.append({
+            "type": "image_url",
+            "image_url": {
+                "url": image_data_url(os.path.join(ASSETS_DIR, 'scenarios', img_file))
+            }
+        })
+
+    try:
+        # Using gpt-4o for reliable Vision support
+        raw_json = _chat("gpt-4o", SYSTEM_PROMPT_SCENARIO, content)
+        by_label = {}
+        for q in decode_batch(raw_json):
+            if q.get('image') in labels:
+                by_label.setdefault(q['image'], q)
+        
+        # Images without a (correctly labelled) question stay unused and are
+        # picked up again by a later run
+        missing = [img_file for label, img_file in labels.items() if label not in by_label]
+        if missing:
+            _log(f"    No question came back for {', '.join(missing)}; skipping them.")
+        
+        # Post-process: ensure ID unique (image is already the asset path)
+        questions = [by_label[label] for label in labels if label in by_label]
+        for q in questions:
+            q['id'] = f"kor-scene-{secrets.token_hex(3)}"
+        return questions
+            
+    except Exception as e:
+        _log(f"    Failed to generate for {', '.join(img_files)}: {e}")
+        return None
 
 def run_scenario_generator(count=5):
     """
@@ -459,7 +727,9 @@ def run_scenario_generator(count=5):
     3. Sends image to GPT-4o Vision to generate scenario question
     """
     scenarios_dir = os.path.join(ASSETS_DIR, 'scenarios')
-    if not os.path.exists(scenarios_dir):
+    try:
+        entries = list(os.scandir(scenarios_dir))
+    except FileNotFoundError:
         print(f"Error: {scenarios_dir} not found. Run fetch_scenarios.py first.")
         return
 
@@ -467,21 +737,22 @@ def run_scenario_generator(count=5):
     
     # Check used images
     used_images = set()
-    if os.path.exists(output_file):
-        existing_data = load_existing(output_file)
-        if existing_data:
-             for q in existing_data:
-                 if q.get('image'):
-                     # stored as "scenarios/filename.jpg" usually
-                     used_images.add(os.path.basename(q['image']))
-    else:
-        existing_data = []
+    existing_data = load_existing(output_file)
+    for q in existing_data:
+        if q.get('image'):
+            # stored as "scenarios/filename.jpg" usually
+            used_images.add(os.path.basename(q['image']))
 
-    # Find available images
-    all_files = [f for f in os.listdir(scenarios_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-    available = [f for f in all_files if f not in used_images]
+    # Find available images (one directory pass; DirEntry knows the file type)
+    image_count = 0
+    available = []
+    for entry in entries:
+        if entry.name.lower().endswith(('.jpg', '.jpeg', '.png')) and entry.is_file():
+            image_count += 1
+            if entry.name not in used_images:
+                available.append(entry.name)
     
-    print(f"\nFound {len(all_files)} images, {len(available)} available.")
+    print(f"\nFound {image_count} images, {len(available)} available.")
     
     if not available:
         print("No new scenario images to process.")
@@ -491,71 +762,81 @@ def run_scenario_generator(count=5):
     if count > len(available):
         to_process = available
     else:
-        to_process = random.sample(available, count)
+        to_process = _reservoir(available, count)
         
     print(f"Processing {len(to_process)} images...")
     
-    new_questions = []
+    # Images are sent SCENARIO_BATCH_SIZE at a time, so the system prompt and
+    # schema are paid once per batch. Batches are independent, network-bound
+    # requests, so they run in a thread pool; map() keeps to_process order.
+    batches = [to_process[i:i + SCENARIO_BATCH_SIZE] for i in range(0, len(to_process), SCENARIO_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=SCENARIO_CONCURRENCY) as executor:
+        results = list(executor.map(_generate_for_images, batches))
     
-    for img_file in to_process:
-        print(f"  > Analyzing {img_file}...")
-        img_path = os.path.join(scenarios_dir, img_file)
-        base64_image = encode_image(img_path)
-        
-        system_prompt = get_system_prompt('korkortsteori')
-        # Tweak prompt for Vision
-        system_prompt += "\n\nOBS: Du kommer få en bild på en trafiksituation. Din uppgift är att skapa en teorifråga baserad på vad föraren ser (man ser inte alltid motorhuven/ratten, men utgå från kamerans perspektiv). Identifiera risker, regler eller vägmärken i bilden."
-
-        try:
-            # Using gpt-4o for reliable Vision support
-            completion = client.chat.completions.create(
-                model="gpt-4o", 
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"type": "text", "text": "Analysera trafiksituationen i denna bild. Skapa EN utmanande körkortsfråga (flerval) baserad på bilden. Vad bör föraren tänka på? Vilka regler gäller? Var specifik kopplat till bildens innehåll."},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                 response_format={
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": "question_batch",
-                        "schema": build_question_batch_schema(),
-                        "strict": True
-                    }
-                }
-            )
-            
-            raw_json = completion.choices[0].message.content
-            batch = QuestionBatch.model_validate_json(raw_json)
-            
-            # Post-process: Add image path and ensure ID unique
-            for q in batch.questions:
-                q.image = f"scenarios/{img_file}" # Relative to assets/
-                q.id = f"kor-scene-{uuid.uuid4().hex[:6]}"
-                new_questions.append(q.model_dump())
-                
-        except Exception as e:
-            print(f"    Failed to generate for {img_file}: {e}")
+    new_questions = [q for questions in results if questions for q in questions]
 
     # Save
     if new_questions:
-        all_data = existing_data + new_questions
-        with open(output_file, 'w', encoding='utf-8') as f:
-            yaml.dump(all_data, f, sort_keys=False, allow_unicode=True)
+        append_questions(output_file, existing_data, new_questions)
         print(f"\nSaved {len(new_questions)} new scenario questions to {output_file}")
 
 
-def main():
+async def post_chat_completion(payload):
+    """POSTs a chat completion request and returns the first message's content."""
+    # Only the message text is needed, so the JSON is read directly rather
+    # than being validated into the SDK's response models first.
+    # Like the SDK, rate limits, server errors and dropped connections are
+    # retried with exponential backoff.
+    body = orjson.dumps(payload)
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            response = await http_client.post(f"{OPENAI_BASE_URL}/chat/completions", headers=API_HEADERS, content=body)
+        except httpx.TransportError as e:
+            error = e
+        else:
+            if response.status_code == 200:
+                return orjson.loads(response.content)["choices"][0]["message"]["content"]
+            error = RuntimeError(f"HTTP {response.status_code}: {response.text}")
+            if response.status_code != 429 and response.status_code < 500:
+                raise error
+        if attempt == RETRY_ATTEMPTS - 1:
+            raise error
+        delay = 2 ** attempt + random.random()
+        _log(f"  {error}; retrying in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+
+async def request_questions(system_prompt, user_prompt, cache_key, semaphore):
+    """Requests one batch of questions (or reads it from the cache) and returns them as dicts."""
+    raw_json = llm_cache.get(cache_key) if cache_key else None
+    if raw_json is not None:
+        print("  Using cached response for an identical request (--no-cache to skip).")
+        return decode_batch(raw_json)
+    
+    payload = {
+        "model": "gpt-5-mini",
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ],
+        **CHAT_KWARGS_STRICT,
+        "verbosity": "low",
+        "reasoning_effort": "medium"
+    }
+    async with semaphore:
+        if USE_SDK:
+            # Standard Structured Outputs (Non-Beta)
+            completion = await aclient.chat.completions.create(**payload)
+            raw_json = completion.choices[0].message.content
+        else:
+            raw_json = await post_chat_completion(payload)
+    
+    # Manually parse the strict JSON response
+    questions = decode_batch(raw_json)
+    if cache_key and questions:
+        llm_cache.put(cache_key, raw_json)
+    return questions
+
+async def amain():
     print("--- Iller6 Content Factory (Structured v2026) ---")
     
     # 1. Select Subject
@@ -626,11 +907,15 @@ def main():
     filepath = os.path.join(DATA_DIR, subject, filename)
     
     # 3. Analyze Context
-    existing = load_existing(filepath)
-    tag_summary, total_count = analyze_existing_content(existing)
-    subject_tag_summary, subject_total_count = analyze_tag_usage_across_subject(subject)
+    existing = load_existing_cached(filepath)
+    # One pass over the subject folder counts tags for both the topic and the
+    # whole subject (from the tag index where it is current). Run it in a
+    # worker thread while the user answers the remaining prompts, and collect
+    # it just before the request is built.
+    subject_scan = asyncio.get_running_loop().run_in_executor(
+        None, analyze_subject, subject, filename)
     
-    print(f"  Loaded {total_count} existing questions.")
+    print(f"  Loaded {len(existing)} existing questions.")
     
     # 4. Config
     # For körkortsteori, default to using images (road signs)
@@ -662,14 +947,33 @@ def main():
     road_sign_context = get_road_sign_context(subject)
     
     # Create ID prefix based on subject (use first 3 characters)
-    # Subject-specific prefix mapping for better readability
-    id_prefix_map = {
-        'korkortsteori': 'kor',
-        'medical_exam': 'med',
-    }
-    id_prefix = id_prefix_map.get(subject, subject[:3].lower())
+    id_prefix = ID_PREFIX_MAP.get(subject, subject[:3].lower())
     
-    user_prompt = f"""
+    tag_summary, total_count, subject_tag_summary, subject_total_count, _ = await subject_scan
+    
+    # Large requests are split into BATCH_SIZE-question parts that run
+    # concurrently, so latency tracks one small call instead of one big one.
+    # Each part gets its own ID seed to keep IDs unique across parts.
+    parts = [BATCH_SIZE] * (count_req // BATCH_SIZE)
+    if count_req % BATCH_SIZE:
+        parts.append(count_req % BATCH_SIZE)
+    
+    # Parts can't see each other's output, so each one gets its own share of
+    # the topic's least-covered tags to focus on (instead of all parts filling
+    # the same gaps with near-identical questions).
+    gap_tags = sorted(tag_summary, key=tag_summary.get)
+    part_focus = [gap_tags[part::len(parts)] for part in range(len(parts))] if len(parts) > 1 else [[]] * len(parts)
+    
+    # Identical requests (same prompt minus the random ID seed) are served from
+    # the local cache, e.g. when retrying a run whose save step failed.
+    use_cache = '--no-cache' not in sys.argv
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    
+    requests = []
+    for part, n in enumerate(parts):
+        id_seed = secrets.token_hex(2)
+        focus = f"\n    - FOKUS: Denna del av körningen ska främst täcka taggarna {', '.join(part_focus[part])}; övriga delar täcker resten." if part_focus[part] else ""
+        user_prompt = f"""
     Ämne: {subject}
     Topic: {filename.replace('.yaml', '')}
     Bilder: {'JA' if use_images else 'NEJ'}
@@ -679,69 +983,78 @@ def main():
     - I hela ämnesmappen ({subject}) finns {subject_total_count} frågor.
 
     TAGGAR (använd detta för att förstå vad som redan täcks och vad som saknas):
-    - Tagg-frekvens (denna topic): {json.dumps(tag_summary, ensure_ascii=False)}
-    - Tagg-frekvens (hela ämnet): {json.dumps(subject_tag_summary, ensure_ascii=False)}
+    - Tagg-frekvens (denna topic): {format_tag_summary(tag_summary)}
+    - Tagg-frekvens (hela ämnet): {format_tag_summary(subject_tag_summary)}
     
     {road_sign_context}
 
     UPPGIFT:
-    Generera {count_req} nya frågor.
-    - FYLL LUCKOR i ämnet: skapa frågor som kompletterar det som saknas.
+    Generera {n} nya frågor.
+    - FYLL LUCKOR i ämnet: skapa frågor som kompletterar det som saknas.{focus}
     - Återanvänd gärna existerande taggar när det passar; introducera nya endast om nödvändigt.
-    - Generera unika IDn med format ex: "{id_prefix}-gen-{uuid.uuid4().hex[:4]}-..."
+    - Generera unika IDn med format ex: "{id_prefix}-gen-{id_seed}-..."
     """
+        cache_key = llm_cache.make_key(
+            model="gpt-5-mini",
+            system=system_prompt,
+            user=user_prompt.replace(f"-gen-{id_seed}-", "-gen-"),
+            schema=QUESTION_BATCH_SCHEMA_WIRE,
+            part=part,
+        ) if use_cache else None
+        requests.append(request_questions(system_prompt, user_prompt, cache_key, semaphore))
+    
+    results = await asyncio.gather(*requests, return_exceptions=True)
+    
+    # Keep whatever parts succeeded, minus questions another part already
+    # asked (same text, ignoring case and whitespace)
+    new_data = []
+    seen_questions = set()
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Error during generation: {result}")
+            # Fallback debug
+            if hasattr(result, 'body'):
+                 print(result.body)
+            continue
+        for q in result:
+            text = " ".join(str(q.get('question', '')).casefold().split())
+            if text in seen_questions:
+                continue
+            seen_questions.add(text)
+            new_data.append(q)
+    duplicates = sum(len(r) for r in results if not isinstance(r, Exception)) - len(new_data)
+    if duplicates:
+        print(f"Dropped {duplicates} duplicate questions across parts.")
+    
+    if not new_data:
+        print("Error: No questions generated.")
+        return
     
     try:
-        # Standard Structured Outputs (Non-Beta)
-        completion = client.chat.completions.create(
-            model="gpt-5-mini", 
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "question_batch",
-                    "schema": build_question_batch_schema(),
-                    "strict": True
-                }
-            },
-            verbosity="low",
-            reasoning_effort="medium"
-        )
-        
-        # Manually parse the strict JSON response
-        raw_json = completion.choices[0].message.content
-        batch = QuestionBatch.model_validate_json(raw_json)
-        
-        if not batch or not batch.questions:
-            print("Error: No questions generated.")
-            return
+        print(f"\nGenerated {len(new_data)} questions successfully.")
 
-        print(f"\nGenerated {len(batch.questions)} questions successfully.")
-        
-        # Convert Pydantic models back to dicts for YAML saving
-        new_data = [q.model_dump() for q in batch.questions]
-
-        # Ensure IDs are truly unique if LLM failed (double check)
+        # Assign the final IDs here rather than trusting the model's: this uses
+        # the subject's own prefix and stays unique when a cached response is reused
         for q in new_data:
-            if 'med-gen' not in q['id']:
-                 q['id'] = f"med-gen-{uuid.uuid4().hex[:6]}"
+            q['id'] = f"{id_prefix}-gen-{secrets.token_hex(3)}"
 
-        # Append to file
-        all_data = existing + new_data
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            yaml.dump(all_data, f, sort_keys=False, allow_unicode=True)
+        # Append to file (only the new questions are serialized)
+        append_questions(filepath, existing, new_data)
+        update_tag_index(subject, filename, new_data)
             
         print(f"Saved to {filepath}")
         
     except Exception as e:
         print(f"Error during generation: {e}")
-        # Fallback debug
-        if hasattr(e, 'body'):
-             print(e.body)
+
+async def run():
+    try:
+        await amain()
+    finally:
+        await http_client.aclose()
+
+def main():
+    asyncio.run(run())
 
 if __name__ == '__main__':
     main()
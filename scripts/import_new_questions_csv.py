@@ -1,21 +1,45 @@
 import os
+import sys
 import csv
+import atexit
 import yaml
-import json
 import uuid
-import concurrent.futures
+import asyncio
+import random
 import threading
 from typing import List, Optional
+import orjson
+import httpx
 from pydantic import BaseModel, Field
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError, APITimeoutError
 from collections import defaultdict
 
+import llm_cache
+from file_io import atomic_write_bytes, is_block_list, append_to_block_list
+
+# Prefer the libyaml-backed C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
 # -------------------------------------------------------------------------
 # CONSTANTS & SETUP
 # -------------------------------------------------------------------------
 CSV_FILE = 'New_questions.csv'
 IMPORT_LOG = 'data/medical_exam/new_questions_import_log.json'
 DEST_DIR = 'data/medical_exam'
+IMPORT_BATCH_SIZE = 10 # Questions per API call (system prompt + schema are paid once per batch)
+MAX_CONCURRENT_REQUESTS = 25 # In-flight API calls
+RETRY_ATTEMPTS = 3 # Per call, for rate limits and timeouts
+FLUSH_EVERY = 50 # Imported questions buffered before the category files are rewritten
+LOG_FLUSH_EVERY = 50 # Log additions buffered before the import log is rewritten
+RESPONSE_CACHE_TTL = 30 * 24 * 60 * 60 # Seconds a cached per-question result is reused
+USE_CACHE = '--no-cache' not in sys.argv # --no-cache ignores cached results (fresh ones still replace them)
+# Reformatting plus picking the correct option needs little reasoning, and
+# reasoning tokens dominate latency and cost. --reasoning-medium restores
+# the old setting, e.g. to compare accuracy on a sample before a full run.
+REASONING_EFFORT = "medium" if '--reasoning-medium' in sys.argv else "minimal"
 
 # Categories Map: Input Key (normalized) -> Output Filename
 CATEGORY_FILES = {
@@ -39,7 +63,19 @@ CATEGORY_FILES = {
     'oron-nasa-hals-sjukdomar': 'oron_nasa_hals.yaml'
 }
 
-client = OpenAI()
+# Category lookup: keys are normalized the same way as the model's category
+# (lowercase, no Swedish accents, spaces/hyphens -> underscores), so
+# get_dest_file is a single dict lookup.
+_TRANS = str.maketrans({'ö': 'o', 'ä': 'a', 'å': 'a', ' ': '_', '-': '_'})
+_NORMALIZED = {k.translate(_TRANS): v for k, v in CATEGORY_FILES.items()}
+
+# One pooled HTTP/2 connection carries all concurrent requests (multiplexed),
+# instead of one TLS handshake per in-flight request. Needs httpx[http2].
+aclient = AsyncOpenAI(http_client=httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+    timeout=180.0
+))
 
 # -------------------------------------------------------------------------
 # PYDANTIC MODELS (Reused for OpenAI Structured Outputs)
@@ -68,6 +104,12 @@ class ClassifiedQuestion(StrictBaseModel):
 # -------------------------------------------------------------------------
 # PROMPT
 # -------------------------------------------------------------------------
+# The system prompt is a fixed constant (no per-row interpolation) and long
+# enough (>1024 tokens) for the API's automatic prompt caching, so every
+# request after the first pays for it at the cached rate. Everything that
+# varies per row goes in the user message.
+PROMPT_CACHE_KEY = "iller6-import-v1"
+
 SYSTEM_PROMPT = """
 You are an expert Swedish medical tutor refactoring exam questions.
 I will provide a raw question and a list of options. The raw data likely lacks the correct answer indication.
@@ -82,73 +124,167 @@ Your task is to:
 
 Output must be valid JSON matching the schema.
 Language: Swedish.
-"""
+
+CATEGORY GUIDE (the category decides which topic file the question is saved to; pick the single best fit):
+- Neurologi: stroke, epilepsy, headache, MS, Parkinson's disease, dementia, peripheral nerve injuries, neuroanatomy.
+- Internmedicin: general internal medicine, infections, rheumatology, multimorbidity, work-up of unspecific symptoms.
+- Allmänmedicin: primary care, prevention, screening, evidence and study design, consultation technique, common outpatient problems.
+- Psykiatri: depression, anxiety, psychosis, bipolar disorder, substance use, suicide risk, compulsory care (LPT, LVM), psychopharmacology.
+- Ortopedi: fractures, joints, back pain, sports injuries, musculoskeletal complaints.
+- Kirurgi: acute abdomen, surgical procedures, trauma, bowel obstruction, hernias, postoperative complications.
+- Akutmedicin: emergency department work, ABCDE, shock, sepsis, poisonings, life-threatening conditions and their first-line treatment.
+- Diabetologi: type 1 and type 2 diabetes, insulin, glucose-lowering drugs, ketoacidosis, hypoglycaemia, diabetic complications.
+- Endokrinologi: thyroid, adrenal and pituitary disease, calcium metabolism, other hormonal disorders.
+- Gastroenterologi: oesophagus, stomach and bowel, IBD, dyspepsia, GI bleeding, diarrhoea, coeliac disease, pancreas.
+- Hepatologi: liver disease, hepatitis, cirrhosis, jaundice, liver function tests, biliary tract.
+- Hematologi: anaemia, leukaemia, lymphoma, myeloma, coagulation, platelets, blood counts.
+- Kardiologi: coronary artery disease, myocardial infarction, heart failure, arrhythmias, valvular disease, ECG, hypertension.
+- Lungmedicin: asthma, COPD, pneumonia, pulmonary embolism, lung cancer, respiratory physiology and blood gases.
+- Njurmedicin: kidney failure, electrolytes, acid-base disorders, glomerulonephritis, dialysis, urinalysis.
+- Klinisk Farmakologi: prescribing rules, adverse effects, interactions, dosing, pharmacokinetics, generic substitution.
+- Öron-Näsa-Hals: ear and hearing, vertigo, sinuses, pharynx and larynx, tonsillitis, otitis.
+If a question spans several areas, choose the one whose specialist would normally own the clinical decision asked about.
+
+QUALITY RULES:
+- Question: keep every clinical fact (age, sex, duration, vital signs, lab values and units) exactly as given. Fix spelling and grammar, remove redundant words, but never add new facts and never hint at the answer in the stem.
+- Options: keep the given options and their order; only correct the language. Mark exactly one option as correct unless the question explicitly asks for several.
+- Feedback: one short sentence per option that explains the reasoning (mechanism, guideline or key distinguishing finding). Do not merely restate the option, and do not start with "Rätt", "Fel", "Korrekt" or "Felaktigt".
+- Tags: 1-3 short Swedish noun phrases with an initial capital letter (e.g. "Hjärtsvikt", "Antikoagulation", "Diagnostik"). Tags describe the topic, never the answer.
+- Explanation: 2-3 sentences summarising the key concept and why the correct option is right.
+- Terminology: use the Swedish medical terms used in Swedish healthcare and Swedish guidelines (e.g. "hjärtinfarkt", "förmaksflimmer"), and SI units as reported by Swedish laboratories (mmol/L, g/L, µmol/L).
+- Fixed fields: "type" is always "multiple_choice" and "image" is always null for this import.
+- Several questions: when the input contains several numbered questions, handle each one independently and return the results in the same order as the input, one result per question.
+
+EXAMPLE RESULT FOR ONE QUESTION:
+{
+  "category": "Kardiologi",
+  "data": {
+    "type": "multiple_choice",
+    "tags": ["Hjärtinfarkt", "EKG"],
+    "question": "En 65-årig man har haft bröstsmärta i en timme. EKG visar ST-höjningar i II, III och aVF. Vilket kranskärl är mest sannolikt ockluderat?",
+    "image": null,
+    "options": [
+      { "text": "LAD (left anterior descending artery)", "correct": false, "feedback": "Ocklusion av LAD ger i regel ST-höjningar anteriort i V1-V4." },
+      { "text": "RCA (right coronary artery)", "correct": true, "feedback": "Inferiora ST-höjningar orsakas oftast av ocklusion i höger kranskärl." },
+      { "text": "Huvudstam", "correct": false, "feedback": "Huvudstamsocklusion ger utbredda förändringar och oftast kardiogen chock." }
+    ],
+    "explanation": "ST-höjning i II, III och aVF talar för inferior infarkt. Inferiora väggen försörjs hos de flesta av RCA, som därför är det mest sannolika stoppet."
+  }
+}
+""".strip()
 
 # -------------------------------------------------------------------------
 # HELPERS
 # -------------------------------------------------------------------------
-file_locks = defaultdict(threading.Lock)
+# One lock per destination file, created up front for every file
+# get_dest_file can return
+file_locks = {fname: asyncio.Lock() for fname in set(CATEGORY_FILES.values()) | {"blandat.yaml"}}
+
+def _file_lock(filename):
+    return file_locks.get(filename) or file_locks.setdefault(filename, asyncio.Lock())
 log_lock = threading.Lock()
+# One flush at a time: a second flush could otherwise log IDs whose questions
+# the first one is still writing, and a crash in between would lose them
+flush_lock = asyncio.Lock()
+
+# Imported questions wait here until the next flush_all(), so each category
+# file is parsed and rewritten once per FLUSH_EVERY imports, not once per import.
+pending = defaultdict(list) # { filename: [questions] }
+pending_ids = [] # CSV IDs whose questions are in `pending`
 
 def load_log():
     if os.path.exists(IMPORT_LOG):
         try:
-            with open(IMPORT_LOG, 'r', encoding='utf-8') as f:
-                return set(json.load(f))
+            with open(IMPORT_LOG, 'rb') as f:
+                return set(orjson.loads(f.read()))
         except:
             return set()
     return set()
 
-def append_to_log(processed_id):
+# Processed CSV IDs live in memory for the whole run; the log file is only
+# rewritten every LOG_FLUSH_EVERY additions, after each flush and at exit.
+processed_ids = set()
+_log_dirty = 0
+
+def _write_log():
+    # Caller holds log_lock
+    global _log_dirty
+    atomic_write_bytes(IMPORT_LOG, orjson.dumps(list(processed_ids)))
+    _log_dirty = 0
+
+def flush_log():
     with log_lock:
-        current = load_log()
-        current.add(processed_id)
-        with open(IMPORT_LOG, 'w', encoding='utf-8') as f:
-            json.dump(list(current), f)
+        if _log_dirty:
+            _write_log()
+
+atexit.register(flush_log)
+
+def append_many_to_log(new_ids):
+    global _log_dirty
+    with log_lock:
+        processed_ids.update(new_ids)
+        _log_dirty += len(new_ids)
+        if _log_dirty >= LOG_FLUSH_EVERY:
+            _write_log()
 
 def get_dest_file(category):
-    normalized = category.lower().replace('ö', 'o').replace('ä', 'a').replace('å', 'a').replace(' ', '_').replace('-', '_') # Simple normalization attempts
-    # Check exact map first
-    if category.lower() in CATEGORY_FILES:
-        return CATEGORY_FILES[category.lower()]
+    return _NORMALIZED.get(category.lower().translate(_TRANS), "blandat.yaml") # Fallback
+
+async def safe_append_yaml(filename, question_obj):
+    # We use a lock per filename to avoid race conditions with a running flush
+    async with _file_lock(filename):
+        pending[filename].append(question_obj)
+
+def write_questions(full_path, new_questions):
+    """Adds new_questions to a category file (blocking; flush_file runs it in a worker thread)."""
+    # Ensure directory exists
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
     
-    # Try fuzzy match or default
-    for key, val in CATEGORY_FILES.items():
-        if key in normalized:
-            return val
+    # Appending in YAML is safe if we start a new list item: a block list
+    # dumped by PyYAML concatenates cleanly onto another block list, so
+    # only the new questions are serialized and the file is never re-read.
+    if is_block_list(full_path):
+        append_to_block_list(full_path, new_questions)
+        return
     
-    return "blandat.yaml" # Fallback
-
-def safe_append_yaml(filename, question_obj):
-    full_path = os.path.join(DEST_DIR, filename)
+    # Anything else (new, empty or flow-style file) gets a full rewrite
+    existing_data = []
+    if os.path.exists(full_path):
+        with open(full_path, 'r', encoding='utf-8') as f:
+            try:
+                existing_data = yaml.load(f, Loader=SafeLoader) or []
+            except yaml.YAMLError:
+                existing_data = []
     
-    # We use a lock per filename to avoid race conditions when writing
-    with file_locks[filename]:
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        
-        # We read existing to check format or just append? 
-        # Appending in YAML is safe if we start a new list item.
-        # But standard python yaml dump might not be easy to just 'append' to a list file without reading it all or using stream.
-        # Given files aren't huge, reading and writing is safer for valid syntax.
-        
+    if not isinstance(existing_data, list):
         existing_data = []
-        if os.path.exists(full_path):
-            with open(full_path, 'r', encoding='utf-8') as f:
-                try:
-                    existing_data = yaml.safe_load(f) or []
-                except yaml.YAMLError:
-                    existing_data = []
         
-        if not isinstance(existing_data, list):
-            existing_data = []
-            
-        existing_data.append(question_obj)
-        
-        with open(full_path, 'w', encoding='utf-8') as f:
-            yaml.dump(existing_data, f, allow_unicode=True, sort_keys=False)
+    existing_data.extend(new_questions)
+    
+    atomic_write_bytes(full_path, yaml.dump(existing_data, Dumper=SafeDumper, encoding='utf-8', allow_unicode=True, sort_keys=False))
+
+async def flush_file(filename):
+    """Writes one file's pending questions; different files are written in parallel."""
+    # We use a lock per filename, so new questions for this file wait for the write
+    async with _file_lock(filename):
+        new_questions = pending.pop(filename, None)
+        if new_questions:
+            await asyncio.to_thread(write_questions, os.path.join(DEST_DIR, filename), new_questions)
+
+async def flush_all():
+    """Writes every pending question to its category file, then logs their CSV IDs."""
+    async with flush_lock:
+        # Only rows whose questions are flushed below get logged
+        ids = pending_ids[:]
+        pending_ids.clear()
 
-def build_schema():
+        # The log is only written once every file write has finished
+        await asyncio.gather(*(flush_file(filename) for filename in list(pending)))
+
+        append_many_to_log(ids)
+        flush_log()
+
+def build_schema(batch=False):
     # Helper for OpenAI Strict Mode schema
     option_schema = {
         "type": "object",
@@ -210,6 +346,33 @@ def build_schema():
         "required": ["category", "data"]
     }
 
+    if batch:
+        # Each item echoes the CSV id it answers, so results are matched by id
+        batch_item_schema = {
+            **classified_question_schema,
+            "properties": {
+                "id": {"type": "string", "description": "The id given in brackets before the question"},
+                **classified_question_schema["properties"]
+            },
+            "required": ["id", *classified_question_schema["required"]]
+        }
+        # Strict mode needs an object root, so the array is wrapped
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "ClassifiedQuestionBatch",
+                "schema": {
+                    "type": "object",
+                    "additionalProperties": False,
+                    "properties": {
+                        "questions": {"type": "array", "items": batch_item_schema}
+                    },
+                    "required": ["questions"]
+                },
+                "strict": True
+            }
+        }
+
     return {
         "type": "json_schema",
         "json_schema": {
@@ -219,114 +382,259 @@ def build_schema():
         }
     }
 
+# Built once; every request shares the same response_format objects
+SCHEMA = build_schema()
+BATCH_SCHEMA = build_schema(batch=True)
+
 # -------------------------------------------------------------------------
 # WORKER
 # -------------------------------------------------------------------------
-def process_data(row, original_csv_id):
+def format_question(row):
     question_text = row['Question']
     raw_options = row['Options'] # List of strings
     
-    # Prepare user message
     user_content = f"Question: {question_text}\nOptions:\n"
     for i, opt in enumerate(raw_options):
         user_content += f"{i+1}. {opt}\n"
+    return user_content
+
+async def create_completion(**kwargs):
+    """Calls the chat API, retrying rate limits and timeouts with exponential backoff."""
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return await aclient.chat.completions.create(**kwargs)
+        except (RateLimitError, APITimeoutError) as e:
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise
+            delay = 2 ** attempt + random.random()
+            print(f"   {type(e).__name__}, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+def question_key(question, options):
+    """Returns a cache key for a question that ignores option order and surrounding whitespace.
+
+    The model, prompt, schema and reasoning effort are part of the key, so a
+    changed setup never replays old answers. The 'imp-' prefix lets the
+    cleanup scripts drop these entries along with the imported questions.
+    """
+    return 'imp-' + llm_cache.make_key(
+        model="gpt-5-mini",
+        system=SYSTEM_PROMPT,
+        schema=SCHEMA,
+        effort=REASONING_EFFORT,
+        question=question.strip(),
+        options=sorted(o.strip() for o in options),
+    )
+
+# Rows whose question is identical to one already queued in this run wait here
+# for that row's result instead of costing their own API call.
+waiting_duplicates = defaultdict(list) # { cache_key: [csv_id] }
+
+async def save_result(result, original_csv_id, cache_key=None):
+    if cache_key:
+        raw_json = orjson.dumps(result).decode('utf-8')
+        llm_cache.put(cache_key, raw_json)
+
+    category = result['category']
+    q_data = result['data']
+    
+    # Inject ID
+    # We prefix with imp- to indicate import and use UUID
+    q_data['id'] = f"imp-{uuid.uuid4().hex[:8]}"
+    
+    # Determine destination
+    dest_file = get_dest_file(category)
+    
+    # Save (buffered; logged as a success once flushed)
+    await safe_append_yaml(dest_file, q_data)
+    pending_ids.append(original_csv_id)
+    
+    print(f"✅ Imported CSV ID {original_csv_id} -> {dest_file} (New ID: {q_data['id']})")
+    
+    if len(pending_ids) >= FLUSH_EVERY:
+        await flush_all()
+    
+    # Identical rows get their own copy (and ID) of this result
+    if cache_key:
+        for duplicate_id in waiting_duplicates.pop(cache_key, []):
+            await save_result(orjson.loads(raw_json), duplicate_id)
+
+async def process_data(row, original_csv_id, semaphore):
+    # Prepare user message
+    user_content = format_question(row)
 
     try:
-        print(f"   Contacting OpenAI (gpt-5-mini) for ID {original_csv_id}...")
-        completion = client.chat.completions.create(
-            model="gpt-5-mini", 
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_content}
-            ],
-            response_format=build_schema(),
-            verbosity="low",
-            reasoning_effort="medium"
-        )
-        
-        result = json.loads(completion.choices[0].message.content)
-        category = result['category']
-        q_data = result['data']
-        
-        # Inject ID
-        # We prefix with imp- to indicate import and use UUID
-        q_data['id'] = f"imp-{uuid.uuid4().hex[:8]}"
+        async with semaphore:
+            print(f"   Contacting OpenAI (gpt-5-mini) for ID {original_csv_id}...")
+            completion = await create_completion(
+                model="gpt-5-mini", 
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_content}
+                ],
+                response_format=SCHEMA,
+                verbosity="low",
+                reasoning_effort=REASONING_EFFORT,
+                prompt_cache_key=PROMPT_CACHE_KEY
+            )
         
-        # Determine destination
-        dest_file = get_dest_file(category)
-        
-        # Save
-        safe_append_yaml(dest_file, q_data)
-        
-        # Log success
-        append_to_log(original_csv_id)
-        
-        print(f"✅ Imported CSV ID {original_csv_id} -> {dest_file} (New ID: {q_data['id']})")
+        result = orjson.loads(completion.choices[0].message.content)
+        await save_result(result, original_csv_id, row.get('key'))
         return True
 
     except Exception as e:
         print(f"❌ Failed CSV ID {original_csv_id}: {str(e)}")
         return False
 
+async def process_batch(rows, semaphore):
+    """Classifies several CSV rows in one request, falling back to one request per row on failure."""
+    if len(rows) == 1:
+        return [await process_data(rows[0], rows[0]['id'], semaphore)]
+
+    ids = ', '.join(r['id'] for r in rows)
+    # Rows are tagged with their CSV id, which the model echoes back in each result
+    user_content = f"Process these {len(rows)} questions and return them in the 'questions' array, one entry per question, with the id given in brackets.\n\n"
+    user_content += "\n".join(f"[{r['id']}] {format_question(r)}" for r in rows)
+
+    try:
+        async with semaphore:
+            print(f"   Contacting OpenAI (gpt-5-mini) for IDs {ids}...")
+            completion = await create_completion(
+                model="gpt-5-mini", 
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_content}
+                ],
+                response_format=BATCH_SCHEMA,
+                verbosity="low",
+                reasoning_effort=REASONING_EFFORT,
+                prompt_cache_key=PROMPT_CACHE_KEY
+            )
+        
+        results = {}
+        for result in orjson.loads(completion.choices[0].message.content)['questions']:
+            results.setdefault(str(result.pop('id')), result)
+
+    except Exception as e:
+        print(f"⚠️ Batch failed for IDs {ids}: {str(e)}. Retrying one by one...")
+        return await asyncio.gather(*(process_data(r, r['id'], semaphore) for r in rows))
+
+    # Rows the model skipped (or answered under a wrong id) are retried one by one
+    missing = [r for r in rows if r['id'] not in results]
+    if missing:
+        print(f"⚠️ Batch for IDs {ids} is missing IDs {', '.join(r['id'] for r in missing)}. Retrying them one by one...")
+    retried = asyncio.gather(*(process_data(r, r['id'], semaphore) for r in missing))
+
+    for r in rows:
+        if r['id'] in results:
+            await save_result(results[r['id']], r['id'], r.get('key'))
+    return [True] * (len(rows) - len(missing)) + list(await retried)
+
 # -------------------------------------------------------------------------
 # MAIN
 # -------------------------------------------------------------------------
-def main():
+async def amain():
     if not os.path.exists(CSV_FILE):
         print(f"File {CSV_FILE} not found.")
         return
 
-    processed = load_log()
+    processed_ids.update(load_log())
     
-    rows_to_process = []
+    # Batches are submitted as soon as the CSV reader has filled them, so the
+    # first requests are in flight while the rest of the file is still read.
+    # All requests share one event loop; `semaphore` caps how many are in
+    # flight and `slots` how many batches may be queued at once (the reader
+    # waits for a free slot, so a huge CSV is never held in memory).
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    slots = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS * 2)
+    tasks = []
+    queued = 0
+    seen_keys = set()
+    skipped = []
+
+    async def run_batch(batch):
+        try:
+            return await process_batch(batch, semaphore)
+        finally:
+            slots.release()
+
+    async def submit(batch):
+        await slots.acquire()
+        tasks.append(asyncio.create_task(run_batch(batch)))
     
     print("Reading CSV...")
-    with open(CSV_FILE, 'r', encoding='utf-8-sig') as f: # sig handles BOM if present (Excel)
-        reader = csv.reader(f, delimiter=';')
-        header = next(reader, None)
-        
-        if not header:
-            print("Empty CSV.")
-            return
-
-        for row in reader:
-            if not row: continue
+    try:
+        with open(CSV_FILE, 'r', encoding='utf-8-sig') as f: # sig handles BOM if present (Excel)
+            reader = csv.reader(f, delimiter=';')
+            header = next(reader, None)
             
-            # Row structure: ID; Question; Opt1; Opt2; ...
-            if len(row) < 3: 
-                continue 
+            if not header:
+                print("Empty CSV.")
+                return
+
+            batch = []
+            for row in reader:
+                if not row: continue
                 
-            csv_id = row[0]
-            question = row[1]
-            options = [o for o in row[2:] if o.strip()]
-            
-            # Check skip conditions
-            if csv_id in processed:
-                continue
-            
-            if "[SE BILD" in question or "SE BILD" in question:
-                print(f"Skipping ID {csv_id} (Image required)")
-                append_to_log(csv_id) # Mark as processed so we don't retry forever
-                continue
+                # Row structure: ID; Question; Opt1; Opt2; ...
+                if len(row) < 3: 
+                    continue 
+                    
+                csv_id = row[0]
+                question = row[1]
+                options = [o for o in row[2:] if o.strip()]
                 
-            rows_to_process.append({
-                'id': csv_id,
-                'Question': question,
-                'Options': options
-            })
-
-    print(f"Found {len(rows_to_process)} questions to process.")
-    
-    # Process in parallel
-    WORKERS = 25 # Increased for speed with gpt-5-mini
-    with concurrent.futures.ThreadPoolExecutor(max_workers=WORKERS) as executor:
-        futures = {executor.submit(process_data, r, r['id']): r['id'] for r in rows_to_process}
+                # Check skip conditions
+                if csv_id in processed_ids:
+                    continue
+                
+                if "SE BILD" in question: # Also matches "[SE BILD ...]"
+                    print(f"Skipping ID {csv_id} (Image required)")
+                    skipped.append(csv_id) # Mark as processed so we don't retry forever
+                    continue
+                
+                # Identical questions (same text and options, in any order) are
+                # only sent once: earlier runs' results come from the cache, and
+                # duplicates within this run wait for the first row's result.
+                key = question_key(question, options)
+                cached = llm_cache.get(key, ttl=RESPONSE_CACHE_TTL) if USE_CACHE else None
+                if cached is not None:
+                    print(f"   Using cached result for ID {csv_id} (--no-cache to skip)")
+                    await save_result(orjson.loads(cached), csv_id)
+                    continue
+                if key in seen_keys:
+                    waiting_duplicates[key].append(csv_id)
+                    continue
+                seen_keys.add(key)
+                    
+                batch.append({
+                    'id': csv_id,
+                    'Question': question,
+                    'Options': options,
+                    'key': key
+                })
+                queued += 1
+                if len(batch) == IMPORT_BATCH_SIZE:
+                    await submit(batch)
+                    batch = []
+            
+            if batch:
+                await submit(batch)
         
-        for future in concurrent.futures.as_completed(futures):
-            # We just wait for completion, logging handles output
-            pass
+        # Skipped rows are logged together, with at most one log write
+        append_many_to_log(skipped)
+
+        print(f"Found {queued} questions to process.")
+        # We just wait for completion, logging handles output
+        await asyncio.gather(*tasks)
+    finally:
+        # Save whatever was imported, even if the run was interrupted
+        await flush_all()
 
     print("Done!")
 
+def main():
+    asyncio.run(amain())
+
 if __name__ == "__main__":
     main()
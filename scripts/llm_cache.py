@@ -0,0 +1,42 @@
+# Small on-disk cache for LLM responses, keyed by a hash of the full request.
+# Lets a failed or aborted run be retried without paying for the same call twice.
+import hashlib
+import json
+import os
+import time
+
+from file_io import atomic_write_bytes
+
+CACHE_DIR = '.llm_cache'
+DEFAULT_TTL = 24 * 60 * 60  # seconds
+
+def make_key(**parts):
+    """Returns a stable sha256 hex key for the given request parts."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+def get(key, ttl=DEFAULT_TTL):
+    """Returns the cached response text, or None if missing or expired."""
+    path = os.path.join(CACHE_DIR, f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(path) > ttl:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def put(key, text):
+    """Stores the response text under key (atomic rename, so no torn entries)."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    atomic_write_bytes(os.path.join(CACHE_DIR, f"{key}.json"), text.encode('utf-8'))
+
+def clear(prefix):
+    """Deletes every entry whose key starts with prefix; returns how many were removed."""
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.name.startswith(prefix) and e.name.endswith('.json')]
+    except FileNotFoundError:
+        return 0
+    for e in entries:
+        os.remove(e.path)
+    return len(entries)
@@ -1,10 +1,23 @@
 import os
+import sys
 import yaml
-import json
 import uuid
-import concurrent.futures
+import asyncio
+import random
 import time
-from openai import OpenAI
+import contextlib
+from operator import mul
+import orjson
+import httpx
+from openai import OpenAI, AsyncOpenAI, RateLimitError, APITimeoutError
+
+from file_io import atomic_write_bytes, is_block_list, append_to_block_list
+
+# Prefer the libyaml-backed C loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
 # -------------------------------------------------------------------------
 # CONSTANTS & SETUP
@@ -12,6 +25,21 @@ from openai import OpenAI
 SOURCE_FILE = 'data/medical_exam/incorrectly_formatted_questions/questions.yaml'
 MIGRATION_LOG = 'data/medical_exam/migration_log.json'
 DEST_DIR = 'data/medical_exam'
+BATCH_INPUT_FILE = 'data/medical_exam/migration_batch_input.jsonl'
+BATCH_STATE_FILE = 'data/medical_exam/migration_batch.json' # Submitted job id + categories, resumed if the script is restarted
+
+# Runs of at least this many questions go through the Batch API (half price,
+# no rate limits, finishes within 24h); smaller runs use real-time requests.
+BATCH_API_MIN = 50
+BATCH_POLL_SECONDS = 30
+MAX_CONCURRENT_REQUESTS = 5 # Real-time path: in-flight API calls
+# Reformatting plus picking the correct option needs little reasoning, and
+# reasoning tokens dominate latency and cost. --reasoning-medium restores
+# the old setting, e.g. to compare accuracy on a sample before a full run.
+REASONING_EFFORT = "medium" if '--reasoning-medium' in sys.argv else "minimal"
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_BATCH_SIZE = 2048 # Max inputs per embeddings request
+RETRY_ATTEMPTS = 3 # Per call, for rate limits and timeouts
 
 # Categories Map: Input Key (normalized) -> Output Filename
 # We map the categories user requested.
@@ -36,11 +64,48 @@ CATEGORY_FILES = {
     'oron-nasa-hals-sjukdomar': 'oron_nasa_hals.yaml' # Alias
 }
 
-client = OpenAI() # Assumes ENV var is set
+# Categories are picked by embedding similarity to these descriptions
+# (nearest description wins), so the chat model only has to refine the question.
+CATEGORY_DESCRIPTIONS = {
+    'Neurologi': 'Neurologi: stroke, epilepsi, huvudvärk, MS, Parkinson, demens, perifera nervskador, neuroanatomi.',
+    'Internmedicin': 'Internmedicin: invärtesmedicin, infektioner, reumatologi, multisjuklighet, utredning av ospecifika symtom.',
+    'Allmänmedicin': 'Allmänmedicin: primärvård, vårdcentral, prevention, vetenskap och evidens, patientsamtal, vanliga besvär i öppenvård.',
+    'Psykiatri': 'Psykiatri: depression, ångest, psykos, bipolär sjukdom, beroende, suicidrisk, tvångsvård (LPT, LVM), psykofarmaka.',
+    'Ortopedi': 'Ortopedi: frakturer, leder, rygg, idrottsskador, muskuloskeletala besvär.',
+    'Kirurgi': 'Kirurgi: akut buk, operationer, trauma, ileus, bråck, postoperativa komplikationer.',
+    'Akutmedicin': 'Akutmedicin: akutmottagning, ABCDE, chock, sepsis, förgiftningar, livshotande tillstånd, akut behandling.',
+    'Diabetologi': 'Diabetologi: diabetes typ 1 och 2, insulin, blodsocker, ketoacidos, hypoglykemi, diabeteskomplikationer.',
+    'Endokrinologi': 'Endokrinologi: sköldkörtel, binjurar, hypofys, kalcium, hormonrubbningar.',
+    'Gastroenterologi': 'Gastroenterologi: mage och tarm, IBD, dyspepsi, GI-blödning, diarré, celiaki, pankreas.',
+    'Hepatologi': 'Hepatologi: lever, hepatit, cirros, ikterus, leverprover, gallvägar.',
+    'Hematologi': 'Hematologi: anemi, leukemi, lymfom, koagulation, trombocyter, blodprover.',
+    'Kardiologi': 'Kardiologi: hjärta, kranskärlssjukdom, hjärtinfarkt, hjärtsvikt, arytmier, klaffel, EKG, hypertoni.',
+    'Lungmedicin': 'Lungmedicin: astma, KOL, pneumoni, lungemboli, lungcancer, andning och blodgaser.',
+    'Njurmedicin': 'Njurmedicin: njursvikt, elektrolyter, syra-bas, glomerulonefrit, dialys, urinprover.',
+    'Klinisk Farmakologi': 'Klinisk farmakologi: läkemedel, biverkningar, interaktioner, dosering, förskrivning, farmakokinetik.',
+    'Öron-Näsa-Hals': 'Öron-näsa-hals: öron, hörsel, yrsel, bihålor, svalg, larynx, tonsillit, otit.',
+}
+
+# Category lookup: keys are normalized the same way as the category name
+# (lowercase, no Swedish accents, spaces/hyphens -> underscores)
+_TRANS = str.maketrans({'ö': 'o', 'ä': 'a', 'å': 'a', ' ': '_', '-': '_'})
+_NORMALIZED = {k.translate(_TRANS): v for k, v in CATEGORY_FILES.items()}
+
+# Both clients keep pooled HTTP/2 connections, so concurrent requests are
+# multiplexed instead of each paying a TLS handshake. Needs httpx[http2].
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+client = OpenAI(http_client=httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=180.0)) # Assumes ENV var is set
+aclient = AsyncOpenAI(http_client=httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=180.0))
 
 # -------------------------------------------------------------------------
 # PROMPT
 # -------------------------------------------------------------------------
+# The system prompt is a fixed constant (no per-question interpolation) and
+# long enough (>1024 tokens) for the API's automatic prompt caching, so every
+# request after the first pays for it at the cached rate. Everything that
+# varies per question goes in the user message.
+PROMPT_CACHE_KEY = "iller6-migrate-v1"
+
 SYSTEM_PROMPT = """
 You are an expert Swedish medical tutor refining exam questions.
 Your task is to take a raw, potentially incomplete medical question and reformat it into a structured, high-quality YAML object.
@@ -51,25 +116,53 @@ Formatting Rules:
 3. Tags: Generate 1-3 concise medical tags (e.g. "Arytmi", "Diagnostik").
 4. Feedback: VERY CONCISE (max 1-2 sentences). Explain WHY the option is wrong/right. Do NOT start with "Rätt" or "Fel".
 5. Explanation: Concise summary (2-3 sentences max) of the concept.
-6. Category: Choose the SINGLE best fit from this list:
-   [Neurologi, Internmedicin, Allmänmedicin, Psykiatri, Ortopedi, Kirurgi, Akutmedicin, Diabetologi, Endokrinologi, Gastroenterologi, Hepatologi, Hematologi, Kardiologi, Lungmedicin, Njurmedicin, Klinisk Farmakologi, Öron-Näsa-Hals]
+6. Category: Already decided and given in the input; use it as context only.
+
+Input Fields:
+- Category: the topic area the question has been filed under. Use it to pick fitting tags and terminology; do not return it.
+- Question: the original question text. It may contain typos, shorthand, missing punctuation or leftovers from the source document (numbering, "#23", "SE BILD").
+- Options: the original answer options as a list, in their original order.
+- Correct Index: 0-based index into Options of the correct answer. Trust it; only if it is clearly medically wrong, mark the option you are certain is correct instead.
+- More Info: the source's own explanation, if any. Base the explanation and the feedback on it, shortened and corrected where needed.
+
+Quality Rules:
+- Question: keep every clinical fact (age, sex, duration, vital signs, lab values and units) exactly as given. Fix spelling and grammar, remove source leftovers, but never add new facts and never hint at the answer in the stem.
+- Options: keep all options and their order; only correct the language. Exactly one option has "correct": true unless the question explicitly asks for several.
+- Feedback: one or two short sentences per option giving the reasoning (mechanism, guideline or key distinguishing finding). Do not merely restate the option, and do not start with "Rätt", "Fel", "Korrekt" or "Felaktigt".
+- Tags: short Swedish noun phrases with an initial capital letter (e.g. "Hjärtsvikt", "Antikoagulation", "Diagnostik"). Tags describe the topic, never the answer.
+- Explanation: the key concept and why the correct option is right, in 2-3 sentences.
+- Terminology: use the Swedish medical terms used in Swedish healthcare and Swedish guidelines (e.g. "hjärtinfarkt", "förmaksflimmer"), and SI units as reported by Swedish laboratories (mmol/L, g/L, µmol/L).
+- Fixed fields: "type" is always "multiple_choice". "image" is always null; if the question refers to an image that is not available, rephrase it so it can be answered from the text, or keep it as close to the original as possible.
 
 JSON Structure (Return this object):
 {
-  "category": "Kardiologi", 
-  "data": {
-    "type": "multiple_choice",
-    "tags": ["Tag1", "Tag2"],
-    "question": "Updated question text...",
-    "image": null,
-    "options": [
-      { "text": "Option A", "correct": false, "feedback": "Concise reason..." },
-      { "text": "Option B", "correct": true, "feedback": "Concise reason..." }
-    ],
-    "explanation": "General Explanation..."
-  }
+  "type": "multiple_choice",
+  "tags": ["Tag1", "Tag2"],
+  "question": "Updated question text...",
+  "image": null,
+  "options": [
+    { "text": "Option A", "correct": false, "feedback": "Concise reason..." },
+    { "text": "Option B", "correct": true, "feedback": "Concise reason..." }
+  ],
+  "explanation": "General Explanation..."
 }
-"""
+
+Example:
+Input: Category: Kardiologi / Question: "En 65 årig man söker pga bröstsmärta sen en timma. EKG visar ST-höjning i II, III, aVF. Vilket kranskärl är troligen stopp i?" / Options: ["LAD", "RCA", "Huvudstam"] / Correct Index: 1 / More Info: "Inferior infarkt, oftast RCA."
+Output:
+{
+  "type": "multiple_choice",
+  "tags": ["Hjärtinfarkt", "EKG"],
+  "question": "En 65-årig man har haft bröstsmärta i en timme. EKG visar ST-höjningar i II, III och aVF. Vilket kranskärl är mest sannolikt ockluderat?",
+  "image": null,
+  "options": [
+    { "text": "LAD (left anterior descending artery)", "correct": false, "feedback": "Ocklusion av LAD ger i regel ST-höjningar anteriort i V1-V4." },
+    { "text": "RCA (right coronary artery)", "correct": true, "feedback": "Inferiora ST-höjningar orsakas oftast av ocklusion i höger kranskärl." },
+    { "text": "Huvudstam", "correct": false, "feedback": "Huvudstamsocklusion ger utbredda förändringar och oftast kardiogen chock." }
+  ],
+  "explanation": "ST-höjning i II, III och aVF talar för inferior infarkt. Inferiora väggen försörjs hos de flesta av RCA, som därför är det mest sannolika stoppet."
+}
+""".strip()
 
 # -------------------------------------------------------------------------
 # HELPERS
@@ -77,13 +170,23 @@ JSON Structure (Return this object):
 
 def load_log():
     if os.path.exists(MIGRATION_LOG):
-        with open(MIGRATION_LOG, 'r') as f:
-            return set(json.load(f))
+        with open(MIGRATION_LOG, 'rb') as f:
+            return set(orjson.loads(f.read()))
     return set()
 
 def save_log(processed_ids):
-    with open(MIGRATION_LOG, 'w') as f:
-        json.dump(list(processed_ids), f)
+    atomic_write_bytes(MIGRATION_LOG, orjson.dumps(list(processed_ids)))
+
+def load_batch_state():
+    """Returns { 'batch_id': ..., 'categories': {...} } for an unfinished batch job, or None."""
+    if os.path.exists(BATCH_STATE_FILE):
+        with open(BATCH_STATE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    return None
+
+def clear_batch_state():
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(BATCH_STATE_FILE)
 
 def append_to_yaml(filename, data_object):
     """Thread-safe append roughly (we use a file lock in practice, but here we process linearly after generation or use simple appends)"""
@@ -97,60 +200,201 @@ def append_to_yaml(filename, data_object):
 # WORKER
 # -------------------------------------------------------------------------
 
-def process_question(raw_q):
+def classify_questions(raw_questions):
+    """
+    Picks a category for each raw question by embedding similarity.
+    Returns { number: category_name }.
+    """
+    names = list(CATEGORY_DESCRIPTIONS)
+    response = client.embeddings.create(model=EMBEDDING_MODEL, input=list(CATEGORY_DESCRIPTIONS.values()))
+    category_vecs = [d.embedding for d in response.data]
+    
+    categories = {}
+    for i in range(0, len(raw_questions), EMBEDDING_BATCH_SIZE):
+        chunk = raw_questions[i : i+EMBEDDING_BATCH_SIZE]
+        texts = [f"{q.get('category', '')}: {q.get('question')} {' / '.join(map(str, q.get('options') or []))}" for q in chunk]
+        response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+        
+        # OpenAI embeddings are unit length, so the dot product is the cosine similarity
+        for raw_q, d in zip(chunk, response.data):
+            scores = [sum(map(mul, d.embedding, vec)) for vec in category_vecs]
+            categories[str(raw_q.get('number'))] = names[scores.index(max(scores))]
+    
+    return categories
+
+def build_request(raw_q, category):
+    """Returns the chat.completions parameters for one raw question."""
+    # Prompt construction
+    user_prompt = f"""
+    Original Data:
+    Category: {category}
+    Question: {raw_q.get('question')}
+    Options: {raw_q.get('options')}
+    Correct Index: {raw_q.get('correct_option_index')}
+    More Info: {raw_q.get('more_information')}
+    
+    Refine and Format.
+    """
+    
+    return {
+        "model": "gpt-5-mini",
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        "response_format": { "type": "json_object" },
+        "verbosity": "low",
+        "reasoning_effort": REASONING_EFFORT,
+        "prompt_cache_key": PROMPT_CACHE_KEY
+    }
+
+def parse_result(content, category):
+    """Maps a model response to (category_filename, cleaned_data_object)."""
+    data = orjson.loads(content)
+    
+    category_name = category.lower().translate(_TRANS)
+    
+    # Map to filename (every described category has a file)
+    target_file = _NORMALIZED.get(category_name, 'internmedicin.yaml')
+
+    # Add ID
+    data['id'] = f"med-{category_name[:3]}-{uuid.uuid4().hex[:6]}"
+    
+    return (target_file, data)
+
+async def create_completion(**kwargs):
+    """Calls the chat API, retrying rate limits and timeouts with exponential backoff."""
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return await aclient.chat.completions.create(**kwargs)
+        except (RateLimitError, APITimeoutError) as e:
+            if attempt == RETRY_ATTEMPTS - 1:
+                raise
+            delay = 2 ** attempt + random.random()
+            print(f"  {type(e).__name__}, retrying in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+async def process_question(raw_q, category, semaphore):
     """
     Takes a raw question dict from source yaml.
     Returns (category_filename, cleaned_data_object) or None.
     """
     try:
-        # Prompt construction
-        user_prompt = f"""
-        Original Data:
-        Category Hint: {raw_q.get('category', 'Unknown')}
-        Question: {raw_q.get('question')}
-        Options: {raw_q.get('options')}
-        Correct Index: {raw_q.get('correct_option_index')}
-        More Info: {raw_q.get('more_information')}
-        
-        Refine and Format.
-        """
-        
-        response = client.chat.completions.create(
-            model="gpt-5-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={ "type": "json_object" },
-            verbosity="low",
-            reasoning_effort="medium"
+        async with semaphore:
+            response = await create_completion(**build_request(raw_q, category))
+        return parse_result(response.choices[0].message.content, category)
+
+    except Exception as e:
+        print(f"Error processing {raw_q.get('number', '?')}: {e}")
+        return None
+
+def print_batch_errors(file_id):
+    """Prints the per-request errors from a batch job's error file."""
+    for line in client.files.content(file_id).content.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        response = record.get('response') or {}
+        error = record.get('error') or (response.get('body') or {}).get('error') or response.get('status_code')
+        print(f"Error processing {record.get('custom_id')}: {error}")
+
+def run_batch_job(to_process, categories, batch_id=None):
+    """
+    Submits every question as one Batch API job (or resumes batch_id) and waits for it.
+    Returns { number: (category_filename, cleaned_data_object) } for the successful ones.
+    """
+    if batch_id:
+        # A previous run was interrupted while waiting; pick its job back up
+        # instead of paying for the same requests twice
+        batch = client.batches.retrieve(batch_id)
+        print(f"Resuming batch {batch.id} ({batch.status}).")
+    else:
+        # 1. One JSONL line per question, keyed by its source number
+        with open(BATCH_INPUT_FILE, 'wb') as f:
+            for q in to_process:
+                f.write(orjson.dumps({
+                    "custom_id": str(q.get('number')),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": build_request(q, categories[str(q.get('number'))])
+                }) + b"\n")
+
+        # 2. Upload and start the job (the local copy is not needed once uploaded)
+        try:
+            with open(BATCH_INPUT_FILE, 'rb') as f:
+                batch_file = client.files.create(file=f, purpose="batch")
+        finally:
+            os.remove(BATCH_INPUT_FILE)
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
         )
+        # The categories are saved with the id, so a resumed run does not re-embed
+        atomic_write_bytes(BATCH_STATE_FILE, orjson.dumps({"batch_id": batch.id, "categories": categories}))
+        print(f"Submitted batch {batch.id} ({len(to_process)} requests).")
+
+    # 3. Poll until the job reaches a final state
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        print(f"  Batch {batch.status}: {counts.completed}/{counts.total} done, {counts.failed} failed")
+
+    # Job-level failures (e.g. a rejected input file) come without any files
+    for error in getattr(batch.errors, 'data', None) or []:
+        print(f"Batch error: {error.message}")
+    if batch.error_file_id:
+        print_batch_errors(batch.error_file_id)
+
+    # An expired or cancelled job still has an output file for the requests
+    # that finished; those are saved and the rest are left for the next run
+    if not batch.output_file_id:
+        print(f"Batch ended with status {batch.status}; nothing to save.")
+        return {}
+    if batch.status != "completed":
+        print(f"Batch ended with status {batch.status}; saving the requests that finished.")
+
+    # 4. Download and parse the output (lines are not in input order)
+    results = {}
+    output = client.files.content(batch.output_file_id).content
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        record = orjson.loads(line)
+        number = record['custom_id']
+        response = record.get('response') or {}
+        if record.get('error') or response.get('status_code') != 200:
+            print(f"Error processing {number}: {record.get('error') or response.get('status_code')}")
+            continue
+        try:
+            results[number] = parse_result(response['body']['choices'][0]['message']['content'], categories[number])
+        except Exception as e:
+            print(f"Error processing {number}: {e}")
+
+    return results
+
+def save_results(results_by_file):
+    """Appends { filename: [questions] } to the category files."""
+    for fname, new_questions in results_by_file.items():
+        fpath = os.path.join(DEST_DIR, fname)
         
-        result = json.loads(response.choices[0].message.content)
-        
-        category_name = result['category'].lower().replace('ö', 'o').replace('ä', 'a').replace('å', 'a').replace(' ', '_')
+        # A block list dumped by PyYAML concatenates cleanly onto another
+        # block list, so only the new questions are written
+        if is_block_list(fpath):
+            append_to_block_list(fpath, new_questions)
+            continue
         
-        # Map to filename 
-        # Heuristic matching
-        target_file = None
-        for key, fname in CATEGORY_FILES.items():
-            if key in category_name:
-                target_file = fname
-                break
+        # Load existing to append
+        if os.path.exists(fpath):
+            with open(fpath, 'r', encoding='utf-8') as f:
+                existing = yaml.load(f, Loader=SafeLoader) or []
+        else:
+            existing = []
         
-        if not target_file:
-            # Fallback to internmedicin or generic if unknown
-            target_file = 'internmedicin.yaml' 
-
-        # Add ID
-        data = result['data']
-        data['id'] = f"med-{category_name[:3]}-{uuid.uuid4().hex[:6]}"
+        existing.extend(new_questions)
         
-        return (target_file, data)
-
-    except Exception as e:
-        print(f"Error processing {raw_q.get('number', '?')}: {e}")
-        return None
+        atomic_write_bytes(fpath, yaml.dump(existing, Dumper=SafeDumper, encoding='utf-8', sort_keys=False, allow_unicode=True))
 
 # -------------------------------------------------------------------------
 # MAIN
@@ -159,7 +403,7 @@ def process_question(raw_q):
 def main():
     print("Loading source data...")
     with open(SOURCE_FILE, 'r', encoding='utf-8') as f:
-        source_data = yaml.safe_load(f)
+        source_data = yaml.load(f, Loader=SafeLoader)
     
     print(f"Found {len(source_data)} questions.")
     
@@ -169,65 +413,79 @@ def main():
     # Filter out already processed
     to_process = [q for q in source_data if str(q.get('number')) not in processed_ids]
     print(f"Remaining to process: {len(to_process)}")
+    if not to_process:
+        print("Migration complete!")
+        return
+    
+    batch_state = load_batch_state()
+    if batch_state:
+        # An interrupted batch job is resumed with the categories it was sent with
+        categories = batch_state['categories']
+    else:
+        print("Classifying categories (embeddings)...")
+        categories = classify_questions(to_process)
     
+    if batch_state or len(to_process) >= BATCH_API_MIN:
+        # Bulk run: one Batch API job instead of one request per question
+        results = run_batch_job(to_process, categories, batch_state and batch_state['batch_id'])
+        
+        results_by_file = {} # { filename: [questions] }
+        for q in to_process:
+            number = str(q.get('number'))
+            if number in results:
+                fname, data = results[number]
+                results_by_file.setdefault(fname, []).append(data)
+                processed_ids.add(number)
+        
+        print("  Saving results...")
+        save_results(results_by_file)
+        save_log(processed_ids)
+        clear_batch_state() # Only once saved, so a crash above resumes the same job
+        print("Migration complete!")
+        return
+    
+    asyncio.run(migrate_realtime(to_process, processed_ids, categories))
+    print("Migration complete!")
+
+async def migrate_realtime(to_process, processed_ids, categories):
+    """Migrates a small run with concurrent chat requests, saving every BATCH_SIZE questions."""
     # Batch processing
     BATCH_SIZE = 10 # Process in small batches to save frequently
     
-    # We'll use a ThreadPoolExecutor
-    # BUT we need to be careful not to spam the API too hard if rate limits exists.
-    # 5 workers seems safe.
+    # All requests share one event loop.
+    # BUT we need to be careful not to spam the API too hard if rate limits exists,
+    # so the semaphore keeps MAX_CONCURRENT_REQUESTS in flight.
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
     
     current_batch_results = {} # { filename: [questions] }
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # We submit all, but iterate results as they come
-        # Actually better to submit in chunks
+    for i in range(0, len(to_process), BATCH_SIZE):
+        batch = to_process[i : i+BATCH_SIZE]
         
-        for i in range(0, len(to_process), BATCH_SIZE):
-            batch = to_process[i : i+BATCH_SIZE]
-            futures = {executor.submit(process_question, q): q for q in batch}
-            
-            print(f"Processing batch {i} - {i+BATCH_SIZE}...")
-            
-            for future in concurrent.futures.as_completed(futures):
-                raw_q = futures[future]
-                res = future.result()
-                
-                if res:
-                    fname, data = res
-                    if fname not in current_batch_results:
-                        current_batch_results[fname] = []
-                    current_batch_results[fname].append(data)
-                    
-                    # Mark as processed
-                    processed_ids.add(str(raw_q.get('number')))
-            
-            # SAVE BATCH
-            print("  Saving batch...")
-            for fname, new_questions in current_batch_results.items():
-                fpath = os.path.join(DEST_DIR, fname)
-                
-                # Load existing to append
-                if os.path.exists(fpath):
-                    with open(fpath, 'r', encoding='utf-8') as f:
-                        existing = yaml.safe_load(f) or []
-                else:
-                    existing = []
-                
-                existing.extend(new_questions)
+        print(f"Processing batch {i} - {i+BATCH_SIZE}...")
+        results = await asyncio.gather(*(process_question(q, categories[str(q.get('number'))], semaphore) for q in batch))
+        
+        for raw_q, res in zip(batch, results):
+            if res:
+                fname, data = res
+                if fname not in current_batch_results:
+                    current_batch_results[fname] = []
+                current_batch_results[fname].append(data)
                 
-                with open(fpath, 'w', encoding='utf-8') as f:
-                    yaml.dump(existing, f, sort_keys=False, allow_unicode=True)
-            
-            # Clear batch buffer
-            current_batch_results = {}
-            # Update Log
-            save_log(processed_ids)
-            
-            # Nicety
-            time.sleep(1)
-
-    print("Migration complete!")
+                # Mark as processed
+                processed_ids.add(str(raw_q.get('number')))
+        
+        # SAVE BATCH
+        print("  Saving batch...")
+        save_results(current_batch_results)
+        
+        # Clear batch buffer
+        current_batch_results = {}
+        # Update Log
+        save_log(processed_ids)
+        
+        # Nicety
+        await asyncio.sleep(1)
 
 if __name__ == '__main__':
     main()